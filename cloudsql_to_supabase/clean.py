@@ -1,13 +1,552 @@
+import contextlib
+import functools
+import io
+import mmap
+import os
+import queue
 import re
+import stat
+import threading
 import logging
 from pathlib import Path
-from typing import Optional, List, Tuple 
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, List, Set, Tuple 
 
+try:
+    import re2
+except ImportError:  # google-re2 is optional, see the "re2" extra
+    re2 = None
 
-from . import config 
+try:
+    import hyperscan
+except ImportError:  # hyperscan is optional, see the "hyperscan" extra
+    hyperscan = None
+
+from . import config, utils
 
 logger = logging.getLogger('cloudsql_to_supabase.clean')
 
+# Size of the reads, and of the newline-aligned blocks the dump is cleaned in.
+_BLOCK_SIZE = 1 << 22
+
+# Cleaned bytes, lines processed, lines skipped, modifications applied, and
+# whether the block ends inside COPY data.
+_BlockResult = Tuple[bytes, int, int, int, bool]
+
+# Patterns that do not depend on the target schema/owner are compiled once at
+# import time; only the role/schema-specific ones are built per cleaner. Skip
+# patterns carry no ``^``: they are only ever applied with match semantics,
+# anchored at the start of the line.
+_SKIP_ROLE_DDL = re.compile(rb'\s*(CREATE|ALTER)\s+ROLE\b', re.IGNORECASE)
+_SKIP_BUILTIN_EXTENSION_COMMENT = re.compile(rb'\s*COMMENT ON EXTENSION\s+(?:pg_stat_statements|plpgsql)\s*;', re.IGNORECASE)
+_SKIP_EXTENSION_COMMENT = re.compile(rb'\s*COMMENT ON EXTENSION\b', re.IGNORECASE)
+_SKIP_SESSION_TIMEOUTS = re.compile(rb'\s*SET\s+(?:transaction_timeout|idle_in_transaction_session_timeout|lock_timeout|statement_timeout)\s*=\s*.*?;', re.IGNORECASE)
+_SKIP_READ_ONLY = re.compile(rb'\s*SET\s+default_transaction_read_only\s*=\s*on;', re.IGNORECASE)
+
+_STATIC_SKIP_PATTERNS: Tuple[re.Pattern, ...] = (
+    _SKIP_ROLE_DDL,
+    _SKIP_BUILTIN_EXTENSION_COMMENT,
+    _SKIP_EXTENSION_COMMENT,
+    _SKIP_SESSION_TIMEOUTS,
+    _SKIP_READ_ONLY,
+)
+
+_OWNER_TO = re.compile(rb'OWNER TO (?:"[^"]+"|[^\s;]+);', re.IGNORECASE)
+_CREATE_SCHEMA_PUBLIC = re.compile(rb'^\s*CREATE SCHEMA\s+public\s*;', re.IGNORECASE)
+_ALTER_SCHEMA_PUBLIC_OWNER = re.compile(rb'^\s*ALTER SCHEMA\s+public\s+OWNER TO .*?;', re.IGNORECASE)
+_EMPTY_SEARCH_PATH = re.compile(rb"^\s*SELECT pg_catalog\.set_config\('search_path', '', false\);[ \t]*$", re.IGNORECASE)
+_SET_SEARCH_PATH_PUBLIC = re.compile(rb"^\s*SET search_path = public((?:,\s*|\s*;).*)$", re.IGNORECASE)
+_SET_SEARCH_PATH_ANY = re.compile(rb"^\s*SET search_path = .*?;", re.IGNORECASE)
+_PUBLIC_QUALIFIED = re.compile(rb"\bpublic\.([\w_]+)\b", re.IGNORECASE)
+_ALTER_TABLE_ONLY_PUBLIC = re.compile(rb"ALTER TABLE ONLY public\.([\w_]+)", re.IGNORECASE)
+
+# Every skip pattern and every line-anchored replacement rule starts with one
+# of these keywords; the remaining rules are triggered by the substrings that
+# _rule_hints() derives for the target.
+_CONTROL_PREFIXES = (b'CREATE', b'ALTER', b'COMMENT', b'SET', b'GRANT', b'REVOKE', b'SELECT')
+
+
+def _rule_hints(target_schema: str) -> Tuple[bytes, ...]:
+    """
+    Substrings one of which any unanchored replacement rule needs to match.
+
+    ``public.`` only matters when qualified names are being remapped to
+    another schema; for a ``public`` target just ``owner to`` is left. The
+    hints are lowercase and looked for in the lowercased line: the rules, and
+    the hyperscan prefilter, ignore case, so hand-written lines such as
+    ``owner to x;`` must be rewritten whichever path is taken.
+    """
+    if target_schema == "public":
+        return (b'owner to',)
+    return (b'owner to', b'public.')
+
+
+def _iter_blocks(fd: int, block_size: int) -> Iterator[bytes]:
+    """
+    Yield the contents of ``fd`` in blocks that end on a newline.
+
+    Reads go straight to ``os.read`` in ``block_size`` chunks, skipping the
+    buffered/text IO layers; the partial last line of each read is carried
+    over to the next block. Works on pipes as well as regular files.
+    """
+    tail = b''
+    while True:
+        chunk = os.read(fd, block_size)
+        if not chunk:
+            break
+        cut = chunk.rfind(b'\n') + 1
+        if not cut:
+            tail += chunk
+            continue
+        yield tail + chunk[:cut] if tail else chunk[:cut]
+        tail = chunk[cut:]
+    if tail:
+        yield tail
+
+
+# Blocks queued between the cleaner and the threads that read and write
+# pipes for it, which bounds the memory they hold to a few blocks each.
+_PIPE_QUEUE_DEPTH = 4
+
+
+def _is_pipe(f: BinaryIO) -> bool:
+    try:
+        return stat.S_ISFIFO(os.fstat(f.fileno()).st_mode)
+    except (AttributeError, io.UnsupportedOperation):
+        return False
+
+
+def _read_ahead(blocks: Iterator[bytes]) -> Iterator[bytes]:
+    """
+    Read ``blocks`` in a background thread, a few blocks ahead of the cleaner.
+
+    A pipe only buffers 64 KiB, so without this the process writing into it
+    (pg_dump, zstd) stalls while every block is cleaned.
+    """
+    pending: "queue.Queue" = queue.Queue(_PIPE_QUEUE_DEPTH)
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            for block in blocks:
+                if stop.is_set():
+                    return
+                pending.put(block)
+            pending.put(None)
+        except BaseException as e:
+            pending.put(e)
+
+    threading.Thread(target=produce, name="dump-reader", daemon=True).start()
+    try:
+        while True:
+            block = pending.get()
+            if block is None:
+                return
+            if isinstance(block, BaseException):
+                raise block
+            yield block
+    finally:
+        # Unblock a reader waiting on a full queue so that it sees ``stop``;
+        # one still blocked in a read ends with the process it reads from.
+        stop.set()
+        try:
+            pending.get_nowait()
+        except queue.Empty:
+            pass
+
+
+@contextlib.contextmanager
+def _write_behind(outfile: BinaryIO) -> Iterator[Callable[[bytes], None]]:
+    """
+    Yield a write function that hands blocks to a thread writing ``outfile``.
+
+    Writing a block to a pipe (psql, zstd) then overlaps with cleaning the
+    next one. A failed write is raised from the next call, or on exit.
+    """
+    pending: "queue.Queue" = queue.Queue(_PIPE_QUEUE_DEPTH)
+    errors: List[BaseException] = []
+
+    def consume() -> None:
+        while True:
+            data = pending.get()
+            if data is None:
+                return
+            if errors:
+                continue  # drain, so that write() never blocks on a dead writer
+            try:
+                outfile.write(data)
+            except BaseException as e:
+                errors.append(e)
+
+    writer = threading.Thread(target=consume, name="dump-writer", daemon=True)
+    writer.start()
+
+    def write(data: bytes) -> None:
+        if errors:
+            raise errors[0]
+        pending.put(data)
+
+    try:
+        yield write
+    except BaseException:
+        try:
+            pending.put_nowait(None)
+        except queue.Full:
+            pass
+        raise
+    pending.put(None)
+    writer.join()
+    if errors:
+        raise errors[0]
+
+
+def _advise_sequential(fd: int) -> None:
+    """Tell the kernel a regular file will be read front to back, so it reads further ahead."""
+    # posix_fadvise is not available on every platform (e.g. macOS, Windows).
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+
+def _reopenable_path(f: BinaryIO) -> Optional[str]:
+    """The path ``f`` was opened from, if opening it again gives the same file."""
+    name = getattr(f, "name", None)
+    if not isinstance(name, (str, bytes, os.PathLike)):
+        return None
+    try:
+        if os.path.samestat(os.stat(name), os.fstat(f.fileno())):
+            return os.fsdecode(name)
+    except OSError:
+        pass
+    return None
+
+
+def _newline_aligned_ranges(mm: mmap.mmap, block_size: int) -> Iterator[Tuple[int, int]]:
+    """Yield ``(start, end)`` offsets splitting ``mm`` into blocks that end on a newline."""
+    size, start = len(mm), 0
+    while start < size:
+        end = mm.find(b'\n', min(start + block_size, size) - 1)
+        end = size if end == -1 else end + 1
+        yield start, end
+        start = end
+
+
+def _is_copy_header(line: bytes) -> bool:
+    return line.startswith(b'COPY ') and line.rstrip().endswith(b'FROM stdin;')
+
+
+def _freeze_copy(header: bytes) -> bytes:
+    """
+    Rewrite a ``COPY ... FROM stdin;`` header to load with ``WITH (FREEZE)``.
+
+    Rows loaded with FREEZE are written already frozen and marked visible, so
+    the table is not rewritten again by the first VACUUM. PostgreSQL only
+    allows it for a table created or truncated in the same transaction,
+    which holds when a full dump is loaded in one transaction.
+    """
+    return header.rstrip()[:-1] + b' WITH (FREEZE);\n'
+
+
+def _copy_data_end(block: bytes, start: int) -> Tuple[int, bool]:
+    """
+    Find the end of the COPY data starting at line offset ``start``.
+
+    Returns the offset just past the ``\\.`` terminator line, or the end of
+    the block together with True when the data runs on into the next block.
+    """
+    if block.startswith(b'\\.\n', start):
+        return start + 3, False
+    end = block.find(b'\n\\.\n', start)
+    if end == -1:
+        return len(block), True
+    return end + 4, False
+
+
+def _ends_in_copy(mm: mmap.mmap, start: int, end: int, in_copy: bool) -> bool:
+    """
+    Whether the newline-aligned range ``[start, end)`` ends inside COPY data.
+
+    Searches backwards from the end of the range only, so that the pool's
+    ranges can be handed their starting state without cleaning them first.
+    """
+    lower = max(start - 1, 0)
+    terminator = mm.rfind(b'\n\\.\n', lower, end)
+    header = end
+    while True:
+        header = mm.rfind(b'\nCOPY ', max(lower, terminator), header)
+        if header == -1:
+            break
+        line_end = mm.find(b'\n', header + 1, end)
+        if _is_copy_header(mm[header + 1:end if line_end == -1 else line_end]):
+            return True
+    if terminator != -1:
+        return False
+    if start == 0:
+        line_end = mm.find(b'\n', 0, end)
+        return _is_copy_header(mm[:end if line_end == -1 else line_end])
+    return in_copy
+
+
+def _ranges_with_copy_state(mm: mmap.mmap, block_size: int) -> Iterator[Tuple[int, int, bool]]:
+    """Yield ``(start, end, in_copy)``: the newline-aligned ranges and whether each starts inside COPY data."""
+    in_copy = False
+    for start, end in _newline_aligned_ranges(mm, block_size):
+        yield start, end, in_copy
+        in_copy = _ends_in_copy(mm, start, end, in_copy)
+
+
+# Per-process state of the pool used when cleaning with several workers.
+_worker_cleaner: Optional["DumpCleaner"] = None
+_worker_map: Optional[mmap.mmap] = None
+
+
+def _init_worker(input_file: str, target_schema: str, target_owner: str, audit_skipped: bool, copy_freeze: bool) -> None:
+    global _worker_cleaner, _worker_map
+    # Workers report through their results; keep their setup out of the log.
+    logger.setLevel(logging.WARNING)
+    _worker_cleaner = DumpCleaner(
+        input_file=input_file,
+        target_schema=target_schema,
+        target_owner=target_owner,
+        audit_skipped=audit_skipped,
+        copy_freeze=copy_freeze,
+    )
+    with open(input_file, 'rb') as infile:
+        _worker_map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _clean_range(bounds: Tuple[int, int, bool]) -> _BlockResult:
+    start, end, in_copy = bounds
+    return _worker_cleaner._clean_block(_worker_map[start:end], in_copy)
+
+# Cloud SQL's own administrative roles, which do not exist on Supabase.
+_PROBLEMATIC_ROLES: Tuple[str, ...] = ("cloudsqlsuperuser", "cloudsqladmin")
+
+
+@functools.lru_cache(maxsize=8)
+def _build_problematic_role_pattern(roles: Tuple[str, ...]) -> Optional[str]:
+    if not roles:
+        return None
+    role_patterns = []
+    for role in roles:
+        escaped_role = re.escape(role)
+        role_patterns.append(f'"{escaped_role}"')
+        role_patterns.append(rf'{escaped_role}\b')
+    pattern = rf"(?:{'|'.join(role_patterns)})"
+    logger.debug(f"Problematic role regex part: {pattern}")
+    return pattern
+
+
+@functools.lru_cache(maxsize=8)
+def _build_skip_patterns(roles: Tuple[str, ...]) -> Tuple[re.Pattern, ...]:
+    role_pattern = _build_problematic_role_pattern(roles)
+    if not role_pattern:
+        return _STATIC_SKIP_PATTERNS
+
+    raw_patterns_definitions = [
+        r'\s*SET\s+(?:ROLE|SESSION\s+AUTHORIZATION)\s+' + role_pattern + r'\s*;',
+        r'\s*(?:GRANT|REVOKE).*?' + role_pattern + r'.*?;',
+        r'\s*ALTER DEFAULT PRIVILEGES\s+FOR ROLE\s+' + role_pattern + r'\s+.*?;',
+        r'\s*ALTER (?:TABLE|SCHEMA|SEQUENCE|FUNCTION|VIEW|MATERIALIZED VIEW|TYPE|DOMAIN|FOREIGN DATA WRAPPER|SERVER|EVENT TRIGGER|PUBLICATION|SUBSCRIPTION).* OWNER TO ' + role_pattern + r'\s*;',
+    ]
+    compiled_patterns = list(_STATIC_SKIP_PATTERNS)
+    for p_str in raw_patterns_definitions:
+        try:
+            compiled_patterns.append(re.compile(p_str.encode(), re.IGNORECASE))
+        except re.error as e:
+            logger.error(f"Regex compilation FAILED for skip pattern: >>>{p_str}<<<")
+            logger.error(f"Error details: {e}")
+            raise  
+    return tuple(compiled_patterns)
+
+
+@functools.lru_cache(maxsize=8)
+def _build_skip_matcher(patterns: Tuple[re.Pattern, ...]) -> Callable[[bytes], Optional[re.Pattern]]:
+    """
+    Return a function mapping a line to the first skip pattern it matches.
+
+    All skip patterns are matched in a single anchored pass over the start
+    of the line: with google-re2 installed through an RE2::Set (linear-time
+    DFA, reports every matching pattern at once), otherwise through one
+    ``re`` alternation with a named group per pattern, whose ``lastgroup``
+    names the pattern that hit.
+    """
+    if re2 is not None:
+        options = re2.Options()
+        options.case_sensitive = False
+        skip_set = re2.Set.MatchSet(options)
+        for pattern in patterns:
+            skip_set.Add(pattern.pattern)
+        skip_set.Compile()
+        logger.debug("Matching skip patterns with an RE2 set")
+
+        def match_skip(line: bytes) -> Optional[re.Pattern]:
+            matched = skip_set.Match(line)
+            return patterns[min(matched)] if matched else None
+
+        return match_skip
+
+    skip_union = re.compile(
+        b"|".join(b"(?P<s%d>%s)" % (i, p.pattern) for i, p in enumerate(patterns)), re.IGNORECASE
+    )
+
+    def match_skip(line: bytes) -> Optional[re.Pattern]:
+        m = skip_union.match(line)
+        return None if m is None else patterns[int(m.lastgroup[1:])]
+
+    return match_skip
+
+
+@functools.lru_cache(maxsize=8)
+def _build_skip_scanner(patterns: Tuple[re.Pattern, ...]) -> Optional[Callable[[bytes], Dict[bytes, re.Pattern]]]:
+    """
+    Return a function finding every skipped line of a block in one scan.
+
+    Only available with hyperscan installed, which compiles all skip patterns
+    into a single multi-pattern automaton and runs it over the whole block at
+    once. The result maps each matching line (as found in the block) to the
+    first pattern that matched it. Returns None without hyperscan.
+    """
+    if hyperscan is None:
+        return None
+    # The patterns are written to be matched at the start of one line; over a
+    # block they are anchored with a multiline ``^``, and ``\s`` must not run
+    # on into the next line.
+    expressions = [b'^' + p.pattern.replace(rb'\s', rb'[ \t\r\f\v]') for p in patterns]
+    database = hyperscan.Database()
+    database.compile(
+        expressions=expressions,
+        ids=list(range(len(expressions))),
+        flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_MULTILINE] * len(expressions),
+    )
+    logger.debug("Scanning for skip patterns with hyperscan")
+
+    def scan_skips(block: bytes) -> Dict[bytes, re.Pattern]:
+        hits: Dict[int, int] = {}
+
+        def on_match(pattern_id: int, start: int, end: int, flags: int, context: object) -> None:
+            line_start = block.rfind(b'\n', 0, end) + 1
+            if hits.get(line_start, pattern_id) >= pattern_id:
+                hits[line_start] = pattern_id
+
+        database.scan(block, match_event_handler=on_match)
+        skipped: Dict[bytes, re.Pattern] = {}
+        for line_start, pattern_id in hits.items():
+            line_end = block.find(b'\n', line_start)
+            line = block[line_start:] if line_end == -1 else block[line_start:line_end + 1]
+            skipped[line] = patterns[pattern_id]
+        return skipped
+
+    return scan_skips
+
+
+def _compile_rule_pattern(p_str: str) -> re.Pattern:
+    try:
+        return re.compile(p_str.encode(), re.IGNORECASE)
+    except re.error as e:
+        logger.error(f"Regex compilation FAILED for replacement pattern: >>>{p_str}<<<")
+        logger.error(f"Error details: {e}")
+        raise 
+
+
+@functools.lru_cache(maxsize=8)
+def _build_replacement_rules(target_schema: str, target_owner: str) -> Tuple[Tuple[re.Pattern, bytes], ...]:
+    escaped_schema = re.escape(target_schema)
+    quoted_target_schema = f'"{target_schema}"'
+
+    create_other_schema = _compile_rule_pattern(
+        r'^\s*CREATE SCHEMA\s+(?!public\b)(?!"?' + escaped_schema + r'"?\b)[^;]+?;'
+    )
+    create_target_schema = _compile_rule_pattern(
+        r'^\s*CREATE SCHEMA\s+"?' + escaped_schema + r'"?\s*;'
+    )
+
+    rules: List[Tuple[re.Pattern, str]] = [
+        (_OWNER_TO, f'OWNER TO {target_owner};'),
+        (create_other_schema, '-- Removed CREATE SCHEMA for non-target, non-public schema: \\g<0>'),
+        (_CREATE_SCHEMA_PUBLIC, '-- CREATE SCHEMA public; (commented out, public schema usually exists)'),
+        (create_target_schema, f'-- CREATE SCHEMA {target_schema}; (commented out, handled by import script)'),
+        (_ALTER_SCHEMA_PUBLIC_OWNER, f'-- ALTER SCHEMA public OWNER removed, will be owned by supabase admin/{target_owner}'),
+        (_EMPTY_SEARCH_PATH, "-- SELECT pg_catalog.set_config('search_path', '', false); (emptying search_path removed to preserve command-line or explicit settings)"),
+    ]
+
+    if target_schema != "public":
+        rules.extend([
+            (_SET_SEARCH_PATH_PUBLIC, rf"SET search_path = {quoted_target_schema}, public\1"),
+            (_PUBLIC_QUALIFIED, rf'{quoted_target_schema}.\1'),
+            (_ALTER_TABLE_ONLY_PUBLIC, rf'ALTER TABLE ONLY {quoted_target_schema}.\1'),
+        ])
+    else:
+        rules.append((_SET_SEARCH_PATH_ANY, r"SET search_path = public, pg_catalog;"))
+    return tuple((pattern, replacement.encode()) for pattern, replacement in rules)
+
+
+@functools.lru_cache(maxsize=8)
+def _build_replacer(rules: Tuple[Tuple[re.Pattern, bytes], ...]) -> Callable[[bytes], Tuple[bytes, int]]:
+    """
+    Return a function applying every replacement rule to a line in one pass.
+
+    The rules are fused into a single alternation with one named group per
+    rule. The group that matched selects the replacement: plain literals are
+    returned as they are, templates are expanded against that rule's own
+    pattern so ``\\1``/``\\g<0>`` keep their meaning.
+    """
+    replace_union = re.compile(
+        b"|".join(b"(?P<r%d>%s)" % (i, pattern.pattern) for i, (pattern, _) in enumerate(rules)),
+        re.IGNORECASE,
+    )
+    # The target schema and owner are already baked into the replacements;
+    # only those with backreferences need the template machinery per match.
+    literals = tuple(None if b"\\" in replacement else replacement for _, replacement in rules)
+
+    def dispatch(m: re.Match) -> bytes:
+        index = int(m.lastgroup[1:])
+        literal = literals[index]
+        if literal is not None:
+            return literal
+        pattern, replacement = rules[index]
+        return pattern.fullmatch(m.group()).expand(replacement)
+
+    return functools.partial(replace_union.subn, dispatch)
+
+
+@functools.lru_cache(maxsize=8)
+def _build_replacement_scanner(rules: Tuple[Tuple[re.Pattern, bytes], ...]) -> Optional[Callable[[bytes], Set[int]]]:
+    """
+    Return a function finding the lines of a block a replacement rule may match.
+
+    Only available with hyperscan installed. The rules are compiled in
+    prefilter mode, which approximates what hyperscan cannot run itself
+    (such as lookaheads) so that it may report too many lines but never too
+    few; the lines it reports still go through the replacer. The result is
+    the set of offsets in the block at which those lines start. Returns None
+    without hyperscan.
+    """
+    if hyperscan is None:
+        return None
+    expressions = [pattern.pattern for pattern, _ in rules]
+    database = hyperscan.Database()
+    database.compile(
+        expressions=expressions,
+        ids=list(range(len(expressions))),
+        flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_MULTILINE | hyperscan.HS_FLAG_PREFILTER] * len(expressions),
+    )
+    logger.debug("Prefiltering replacement rules with hyperscan")
+
+    def scan_replacements(block: bytes) -> Set[int]:
+        line_starts: Set[int] = set()
+        add = line_starts.add
+        rfind = block.rfind
+
+        # A match that runs over several lines is reported on its last line,
+        # a false positive at worst; one within a line is always reported.
+        def on_match(pattern_id: int, start: int, end: int, flags: int, context: object) -> None:
+            add(rfind(b'\n', 0, end - 1) + 1)
+
+        database.scan(block, match_event_handler=on_match)
+        return line_starts
+
+    return scan_replacements
+
+
 class DumpCleaner:
     
     def __init__(
@@ -16,110 +555,172 @@ class DumpCleaner:
         output_file: Optional[Path] = None,
         target_schema: Optional[str] = None,
         target_owner: Optional[str] = None, 
+        workers: int = 1,
+        audit_skipped: bool = False,
+        copy_freeze: bool = False,
     ) -> None:
-        self.input_file = Path(input_file or config.OUTPUT_DUMP)
-        self.output_file = Path(output_file or config.CLEANED_DUMP)
+        self.input_file = Path(input_file or config.CONFIG.output_dump)
+        self.output_file = Path(output_file or config.CONFIG.cleaned_dump)
         self.target_schema = target_schema or "public"
         self.target_owner = target_owner or "postgres"
+        self.workers = workers
+        # Leave a "-- SKIPPED LINE" comment in place of each dropped line.
+        self.audit_skipped = audit_skipped
+        # Load table data with COPY ... FREEZE, see _freeze_copy().
+        self.copy_freeze = copy_freeze
 
         logger.info(
             f"Initializing DumpCleaner. Input: '{self.input_file}', Output: '{self.output_file}', "
             f"Target Schema: '{self.target_schema}', Target Owner: '{self.target_owner}'"
         )
 
-        self.problematic_roles_to_filter: List[str] = ["cloudsqlsuperuser", "cloudsqladmin"]
-        self.problematic_role_match_pattern: Optional[str] = self._build_problematic_role_pattern()
-
-        
-        self.skip_patterns: List[re.Pattern] = self._build_skip_patterns()
-        self.replacement_rules: List[Tuple[re.Pattern, str]] = self._build_replacement_rules()
-
-    def _build_problematic_role_pattern(self) -> Optional[str]:
-        if not self.problematic_roles_to_filter:
-            return None
-        role_patterns = []
-        for role in self.problematic_roles_to_filter:
-            escaped_role = re.escape(role)
-            role_patterns.append(f'"{escaped_role}"')
-            role_patterns.append(rf'{escaped_role}\b')
-        pattern = rf"(?:{'|'.join(role_patterns)})"
-        logger.debug(f"Problematic role regex part: {pattern}")
-        return pattern
-
-    def _build_skip_patterns(self) -> List[re.Pattern]:
-        
-        raw_patterns_definitions = [
-            r'^\s*(CREATE|ALTER)\s+ROLE\b',
-            r'^\s*COMMENT ON EXTENSION\s+(?:pg_stat_statements|plpgsql)\s*;',
-            r'^\s*COMMENT ON EXTENSION\b',
-            r'^\s*SET\s+(?:transaction_timeout|idle_in_transaction_session_timeout|lock_timeout|statement_timeout)\s*=\s*.*?;',
-            r'^\s*SET\s+default_transaction_read_only\s*=\s*on;',
-        ]
-
-        if self.problematic_role_match_pattern:
-            raw_patterns_definitions.extend([
-                r'^\s*SET\s+(?:ROLE|SESSION\s+AUTHORIZATION)\s+' + self.problematic_role_match_pattern + r'\s*;',
-                r'^\s*(?:GRANT|REVOKE).*?' + self.problematic_role_match_pattern + r'.*?;',
-                r'^\s*ALTER DEFAULT PRIVILEGES\s+FOR ROLE\s+' + self.problematic_role_match_pattern + r'\s+.*?;',
-                r'^\s*ALTER (?:TABLE|SCHEMA|SEQUENCE|FUNCTION|VIEW|MATERIALIZED VIEW|TYPE|DOMAIN|FOREIGN DATA WRAPPER|SERVER|EVENT TRIGGER|PUBLICATION|SUBSCRIPTION).* OWNER TO ' + self.problematic_role_match_pattern + r'\s*;',
-            ])
-        
-        compiled_patterns = []
-        for p_str in raw_patterns_definitions:
-            try:
-                
-                compiled_patterns.append(re.compile(p_str, re.IGNORECASE))
-            except re.error as e:
-                logger.error(f"Regex compilation FAILED for skip pattern: >>>{p_str}<<<")
-                logger.error(f"Error details: {e}")
-                raise  
-        return compiled_patterns
-
-    def _build_replacement_rules(self) -> List[Tuple[re.Pattern, str]]:
-        owner_replacement_str = f'OWNER TO {self.target_owner};'
-        
-
-        
-        raw_rules_definitions: List[Tuple[str, str]] = [
-            (r'OWNER TO (?:"[^"]+"|[^\s;]+);', owner_replacement_str),
-            (r'^\s*CREATE SCHEMA\s+(?!public\b)(?!"?' + re.escape(self.target_schema) + r'"?\b)[^;]+?;', '-- Removed CREATE SCHEMA for non-target, non-public schema: \\g<0>'),
-            (r'^\s*CREATE SCHEMA\s+public\s*;', '-- CREATE SCHEMA public; (commented out, public schema usually exists)'),
-            (r'^\s*CREATE SCHEMA\s+"?' + re.escape(self.target_schema) + r'"?\s*;', f'-- CREATE SCHEMA {self.target_schema}; (commented out, handled by import script)'),
-            (r'^\s*ALTER SCHEMA\s+public\s+OWNER TO .*?;', f'-- ALTER SCHEMA public OWNER removed, will be owned by supabase admin/{self.target_owner}'),
-            (r"^\s*SELECT pg_catalog\.set_config\('search_path', '', false\);\s*$", "-- SELECT pg_catalog.set_config('search_path', '', false); (emptying search_path removed to preserve command-line or explicit settings)"),
-        ]
-
-        quoted_target_schema = f'"{self.target_schema}"'
-
-        
-        print(f"Current target_schema: '{self.target_schema}'")
-        print(f"Type of target_schema: {type(self.target_schema)}")
-        print(f"Condition result: {self.target_schema != 'public'}")
-
-        if self.target_schema != "public":
-            schema_replacements_raw = [
-                (r"^\s*SET search_path = public(?:,\s*|\s*;)(.*)$", rf"SET search_path = {quoted_target_schema}, public\1"),
-                (r"\bpublic\.([\w_]+)\b", rf'{quoted_target_schema}.\1'),
-                (r"ALTER TABLE ONLY public\.([\w_]+)", rf'ALTER TABLE ONLY {quoted_target_schema}.\1'),
-            ]
-            raw_rules_definitions.extend(schema_replacements_raw)
+        # Compiled rule sets are cached per (roles, schema, owner), so building
+        # another cleaner for the same target costs no regex compilation.
+        self.problematic_roles_to_filter: Tuple[str, ...] = _PROBLEMATIC_ROLES
+        self.problematic_role_match_pattern: Optional[str] = _build_problematic_role_pattern(self.problematic_roles_to_filter)
+        self.skip_patterns: Tuple[re.Pattern, ...] = _build_skip_patterns(self.problematic_roles_to_filter)
+        self._match_skip: Callable[[bytes], Optional[re.Pattern]] = _build_skip_matcher(self.skip_patterns)
+        self._scan_skips: Optional[Callable[[bytes], Dict[bytes, re.Pattern]]] = _build_skip_scanner(self.skip_patterns)
+        self.replacement_rules: Tuple[Tuple[re.Pattern, bytes], ...] = _build_replacement_rules(self.target_schema, self.target_owner)
+        self._apply_replacements: Callable[[bytes], Tuple[bytes, int]] = _build_replacer(self.replacement_rules)
+        self._rule_hints: Tuple[bytes, ...] = _rule_hints(self.target_schema)
+        self._scan_replacements: Optional[Callable[[bytes], Set[int]]] = _build_replacement_scanner(self.replacement_rules)
+
+    def _clean_block(self, block: bytes, in_copy: bool = False) -> _BlockResult:
+        """
+        Clean one newline-aligned block of the dump.
+
+        COPY data never needs cleaning: after a ``COPY ... FROM stdin;``
+        header, everything up to the ``\\.`` terminator is copied through as
+        one slice. ``in_copy`` says whether the block starts inside such data.
+
+        This is the per-line hot loop, so the prescreen is inlined, everything
+        it calls is bound to a local up front and lines are counted with one
+        ``bytes.count`` instead of per iteration. Lines kept as they are are
+        not collected one by one: each run of them goes out as one slice of
+        the block, taken when the next changed line is reached.
+        """
+        out_buf: List[bytes] = []
+        append = out_buf.append
+        control_prefixes = _CONTROL_PREFIXES
+        rule_hints = self._rule_hints
+        # With hyperscan the skipped lines of the whole block are found up
+        # front, leaving a dict lookup per candidate line.
+        match_skip = self._scan_skips(block).get if self._scan_skips else self._match_skip
+        # Likewise the lines a replacement rule may match, instead of the
+        # rule hints.
+        replace_lines = self._scan_replacements(block) if self._scan_replacements else None
+        apply_replacements = self._apply_replacements
+        audit_skipped = self.audit_skipped
+        copy_freeze = self.copy_freeze
+        skipped_lines_count, total_modifications_count = 0, 0
+        lines = io.BytesIO(block)
+        # Start of the run of unchanged lines, and of the current line.
+        kept, pos = 0, 0
+        if in_copy:
+            pos, in_copy = _copy_data_end(block, 0)
+            lines.seek(pos)
+        for line in lines:
+            start = pos
+            pos += len(line)
+            # Data lines (COPY rows, INSERTs) make up the bulk of a dump and
+            # fail both cheap checks below, bypassing the regexes entirely.
+            # Only control statements can be skipped; lines that merely
+            # contain a rule hint go straight to the replacements.
+            if line.lstrip()[:7].upper().startswith(control_prefixes):
+                pattern = match_skip(line)
+                if pattern is not None:
+                    append(block[kept:start])
+                    kept = pos
+                    if audit_skipped:
+                        append(b"-- SKIPPED LINE (by pattern %s): %s\n" % (pattern.pattern, line.strip()))
+                    skipped_lines_count += 1
+                    continue
+                if replace_lines is not None and start not in replace_lines:
+                    continue
+            elif _is_copy_header(line):
+                processed_line, count = apply_replacements(line)
+                if copy_freeze:
+                    processed_line = _freeze_copy(processed_line)
+                    count += 1
+                if count:
+                    total_modifications_count += count
+                    append(block[kept:start])
+                    append(processed_line)
+                    kept = pos
+                # The data joins the run of unchanged lines.
+                pos, in_copy = _copy_data_end(block, pos)
+                lines.seek(pos)
+                continue
+            elif replace_lines is not None:
+                if start not in replace_lines:
+                    continue
+            else:
+                # bytes.find is markedly cheaper than ``in`` for bytes operands,
+                # and lowering the line than a case-insensitive regex.
+                lowered = line.lower()
+                for hint in rule_hints:
+                    if lowered.find(hint) != -1:
+                        break
+                else:
+                    continue
+            processed_line, count = apply_replacements(line)
+            if count:
+                total_modifications_count += count
+                append(block[kept:start])
+                append(processed_line)
+                kept = pos
+        if kept == 0:
+            cleaned = block
         else:
-            raw_rules_definitions.append(
-                (r"^\s*SET search_path = .*?;", r"SET search_path = public, pg_catalog;")
-            )
-        
-        compiled_rules = []
-        for p_str, repl_str in raw_rules_definitions:
-            try:
-                
-                compiled_rules.append((re.compile(p_str, re.IGNORECASE), repl_str))
-            except re.error as e:
-                logger.error(f"Regex compilation FAILED for replacement pattern: >>>{p_str}<<<")
-                logger.error(f"Error details: {e}")
-                raise 
-        return compiled_rules
+            append(block[kept:])
+            cleaned = b"".join(out_buf)
+        lines_processed_count = block.count(b"\n") + (not block.endswith(b"\n") and bool(block))
+        return cleaned, lines_processed_count, skipped_lines_count, total_modifications_count, in_copy
+
+    def _clean_blocks(self, infile: BinaryIO) -> Iterator[_BlockResult]:
+        """
+        Clean the dump block by block, in order.
+
+        Pipes are always cleaned in this process, as the pool needs a regular
+        file to memory-map; so is a file the workers cannot reopen by the
+        name ``infile`` was opened with.
+
+        The only state carried between blocks is whether COPY data is still
+        open, which can be found for each block without cleaning the ones
+        before it. So with ``workers > 1`` blocks are farmed out to a process
+        pool; each worker memory-maps the input itself and only the offsets
+        and the cleaned bytes cross the process boundary.
+        """
+        regular_file = stat.S_ISREG(os.fstat(infile.fileno()).st_mode)
+        if regular_file:
+            _advise_sequential(infile.fileno())
+        path = _reopenable_path(infile) if regular_file and self.workers > 1 else None
+        if path is None:
+            in_copy = False
+            blocks = _iter_blocks(infile.fileno(), _BLOCK_SIZE)
+            if _is_pipe(infile):
+                blocks = _read_ahead(blocks)
+            for block in blocks:
+                result = self._clean_block(block, in_copy)
+                in_copy = result[4]
+                yield result
+            return
+
+        if not os.fstat(infile.fileno()).st_size:
+            return
+        # Only the pool needs multiprocessing; keep it out of the import of
+        # this module, which every CLI command pays for.
+        import multiprocessing
+
+        logger.info(f"Cleaning with {self.workers} worker processes")
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm, multiprocessing.Pool(
+            self.workers,
+            initializer=_init_worker,
+            initargs=(path, self.target_schema, self.target_owner, self.audit_skipped, self.copy_freeze),
+        ) as pool:
+            yield from pool.imap(_clean_range, _ranges_with_copy_state(mm, _BLOCK_SIZE))
 
-    
     def clean_dump_file(self) -> Path:
         logger.info(f"Starting cleaning of dump file: {self.input_file}")
 
@@ -127,55 +728,58 @@ class DumpCleaner:
             logger.error(f"Input file not found: {self.input_file}")
             raise FileNotFoundError(f"Input file not found: {self.input_file}")
 
-        skipped_lines_count, total_modifications_count, lines_processed_count = 0, 0, 0
-
         self.output_file.parent.mkdir(parents=True, exist_ok=True)
 
-        with self.input_file.open('r', encoding='utf-8') as infile, \
-             self.output_file.open('w', encoding='utf-8') as outfile:
-            for line_num, line in enumerate(infile, 1):
-                lines_processed_count += 1
-                processed_line = line
-                skipped_by_pattern = False
-                for pattern in self.skip_patterns: 
-                    if pattern.search(processed_line):
-                        
-                        outfile.write(f"-- SKIPPED LINE (by pattern {pattern.pattern}): {processed_line.strip()}\n")
-                        skipped_lines_count += 1
-                        skipped_by_pattern = True
-                        break
-                if skipped_by_pattern:
-                    continue
+        with utils.open_dump(self.input_file, 'rb') as infile, utils.open_dump(self.output_file, 'wb') as outfile:
+            self.clean_stream(infile, outfile)
+
+        logger.info(f"Cleaned dump saved as {self.output_file}")
+        return self.output_file
 
-                for pattern, replacement in self.replacement_rules: 
-                    processed_line, count = pattern.subn(replacement, processed_line)
-                    if count > 0:
-                        total_modifications_count += count
-                
-                outfile.write(processed_line)
+    def clean_stream(self, infile: BinaryIO, outfile: BinaryIO) -> None:
+        """
+        Clean the dump read from ``infile`` into ``outfile``; either may be a pipe.
+
+        Pipes are read and written by background threads, so the processes on
+        their other ends keep running while a block is being cleaned.
+        """
+        skipped_lines_count, total_modifications_count, lines_processed_count = 0, 0, 0
+
+        with _write_behind(outfile) if _is_pipe(outfile) else contextlib.nullcontext(outfile.write) as write:
+            for cleaned, lines, skipped, modifications, _ in self._clean_blocks(infile):
+                write(cleaned)
+                lines_processed_count += lines
+                skipped_lines_count += skipped
+                total_modifications_count += modifications
 
         logger.info(
             f"Cleaning completed: {lines_processed_count} lines processed, "
             f"{skipped_lines_count} lines skipped, "
             f"{total_modifications_count} total modifications applied."
         )
-        logger.info(f"Cleaned dump saved as {self.output_file}")
-        return self.output_file
 
 def clean_dump_file(
     input_file: Optional[Path] = None,
     output_file: Optional[Path] = None,
     target_schema: Optional[str] = None,
     target_owner: Optional[str] = None, 
+    workers: int = 1,
+    audit_skipped: bool = False,
+    copy_freeze: bool = False,
 ) -> Path:
     """
     Cleans a PostgreSQL dump file to make it suitable for import.
 
+    Either file may be zstd-compressed, as told by its .zst suffix.
+
     Args:
         input_file: Path to the input SQL dump file.
         output_file: Path where the cleaned SQL dump file will be saved.
         target_schema: The target schema for objects (e.g., "public" or "extensions").
         target_owner: The role that should own the objects (e.g., "postgres").
+        workers: Number of processes to clean the dump with.
+        audit_skipped: Keep each skipped line in the output as a SQL comment.
+        copy_freeze: Load table data with COPY ... FREEZE.
 
     Returns:
         Path to the cleaned output file.
@@ -184,6 +788,149 @@ def clean_dump_file(
         input_file=input_file,
         output_file=output_file,
         target_schema= target_schema,
-        target_owner=target_owner
+        target_owner=target_owner,
+        workers=workers,
+        audit_skipped=audit_skipped,
+        copy_freeze=copy_freeze,
     )
     return cleaner.clean_dump_file()
+
+
+def clean_stream(
+    infile: BinaryIO,
+    outfile: BinaryIO,
+    target_schema: Optional[str] = None,
+    target_owner: Optional[str] = None,
+    audit_skipped: bool = False,
+    copy_freeze: bool = False,
+) -> None:
+    """
+    Cleans a PostgreSQL dump read from one binary stream into another.
+
+    Unlike clean_dump_file, nothing is written to disk: the streams can be the
+    pipes of a pg_dump | psql pipeline.
+
+    Args:
+        infile: Binary stream the dump is read from; needs a file descriptor.
+        outfile: Binary stream the cleaned dump is written to.
+        target_schema: The target schema for objects (e.g., "public" or "extensions").
+        target_owner: The role that should own the objects (e.g., "postgres").
+        audit_skipped: Keep each skipped line in the output as a SQL comment.
+        copy_freeze: Load table data with COPY ... FREEZE.
+    """
+    cleaner = DumpCleaner(
+        target_schema=target_schema,
+        target_owner=target_owner,
+        audit_skipped=audit_skipped,
+        copy_freeze=copy_freeze,
+    )
+    cleaner.clean_stream(infile, outfile)
+
+
+def _toc_entries(dump: mmap.mmap) -> Tuple[List[Tuple[int, bool]], bytes]:
+    """
+    Find the TOC entries of a plain-format dump.
+
+    Returns the offset of each entry's comment block with whether it holds
+    table data, and the session settings (``SET`` lines) issued before the
+    first table data. COPY data is stepped over without looking at its lines.
+    """
+    entries: List[Tuple[int, bool]] = []
+    settings: List[bytes] = []
+    seen_data = False
+    comment_start = None
+    pos, size = 0, len(dump)
+    while pos < size:
+        end = dump.find(b'\n', pos)
+        end = size if end == -1 else end + 1
+        line = dump[pos:end]
+        if line.startswith(b'--'):
+            if comment_start is None:
+                comment_start = pos
+            if line.startswith(b'-- Name: ') or line.startswith(b'-- Data for Name: '):
+                is_data = line.startswith(b'-- Data for Name: ')
+                entries.append((comment_start, is_data))
+                seen_data = seen_data or is_data
+        else:
+            comment_start = None
+            if _is_copy_header(line):
+                # Searching from the header's own newline also finds the
+                # terminator of an empty COPY.
+                data_end = dump.find(b'\n\\.\n', end - 1)
+                pos = size if data_end == -1 else data_end + 4
+                continue
+            if not seen_data and (line.startswith(b'SET ') or line.startswith(b'SELECT pg_catalog.set_config(')):
+                settings.append(line)
+        pos = end
+    return entries, b''.join(settings)
+
+
+def _write_span(path: Path, header: bytes, dump: mmap.mmap, src_fd: int, start: int, end: int) -> Path:
+    """
+    Write ``header`` and bytes ``[start, end)`` of the dump to ``path``.
+
+    The span is copied inside the kernel where possible: with
+    copy_file_range (Linux), which can even share the blocks on CoW
+    filesystems, else with sendfile. Where neither works between two files
+    (e.g. macOS, Windows), it is written from the memory-mapped dump.
+    """
+    with open(path, 'wb') as out:
+        out.write(header)
+        out.flush()
+        offset = start
+        try:
+            while offset < end:
+                if hasattr(os, "copy_file_range"):
+                    copied = os.copy_file_range(src_fd, out.fileno(), end - offset, offset)
+                else:
+                    copied = os.sendfile(out.fileno(), src_fd, offset, end - offset)
+                if not copied:
+                    break
+                offset += copied
+        except (AttributeError, OSError):
+            pass
+        for chunk_start in range(offset, end, _BLOCK_SIZE):
+            out.write(dump[chunk_start:min(chunk_start + _BLOCK_SIZE, end)])
+    return path
+
+
+def split_dump_by_table(dump_file: Path, output_dir: Path) -> Tuple[Path, List[Path], Path]:
+    """
+    Split a plain-format dump into files that can be loaded on separate connections.
+
+    pg_dump writes the schema (pre-data), then the data of each table, then
+    the sequence values, constraints and indexes (post-data). The dump is cut
+    along those sections, with each table's data in a file of its own, so the
+    tables can be loaded in parallel between a serial pre-data and post-data
+    load. The session settings of the pre-data section are repeated at the
+    top of every other file.
+
+    Args:
+        dump_file: Plain-format dump to split.
+        output_dir: Directory the files are written to.
+
+    Returns:
+        The pre-data file, the table data files and the post-data file.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(dump_file, 'rb') as f:
+        _advise_sequential(f.fileno())
+        # An empty file cannot be mapped.
+        empty = not os.fstat(f.fileno()).st_size
+        with contextlib.nullcontext(b'') if empty else mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as dump:
+            entries, settings = _toc_entries(dump)
+            size = len(dump)
+            first_data = next((i for i, (_, is_data) in enumerate(entries) if is_data), len(entries))
+            post_data = next((i for i in range(first_data, len(entries)) if not entries[i][1]), len(entries))
+            bounds = [offset for offset, _ in entries[first_data:post_data]] + [entries[post_data][0] if post_data < len(entries) else size]
+
+            src_fd = f.fileno()
+            pre_file = _write_span(output_dir / "pre_data.sql", b'', dump, src_fd, 0, bounds[0])
+            data_files = [
+                _write_span(output_dir / f"data_{n:04d}.sql", settings, dump, src_fd, start, end)
+                for n, (start, end) in enumerate(zip(bounds, bounds[1:]))
+            ]
+            post_file = _write_span(output_dir / "post_data.sql", settings, dump, src_fd, bounds[-1], size)
+
+    logger.info(f"Split {dump_file} into {len(data_files)} table data files")
+    return pre_file, data_files, post_file
@@ -1,7 +1,7 @@
 import click
 import logging
 from pathlib import Path
-from . import export, clean, import_, config
+from . import export, clean, import_, config, pipeline, utils
 
 logger = logging.getLogger('cloudsql_to_supabase.cli')
 
@@ -20,24 +20,70 @@ def cli(verbose):
 @click.option('--skip-clean', is_flag=True, help="Skip the cleaning step")
 @click.option('--source-schema', help="Source schema in CloudSQL to export")
 @click.option('--target-schema', help="Target schema in Supabase to import into")
-def migrate(cloudsql_password, schema_only, skip_export, skip_clean, source_schema, target_schema):
+@click.option('--workers', type=click.IntRange(min=1), default=1, show_default=True, help="Processes used to clean the dump file (not used with --stream)")
+@click.option('--audit-skipped', is_flag=True, help="Keep lines dropped by the cleaner as SQL comments")
+@click.option('--stream/--no-stream', default=None, help="Pipe pg_dump through the cleaner into psql without writing dump files [default: on unless a step is skipped]")
+@click.option('--format', 'dump_format', type=click.Choice(export.DUMP_FORMATS), default="plain", show_default=True, help="Dump format; archives are restored in parallel with pg_restore instead of being cleaned")
+@click.option('--jobs', '-j', type=click.IntRange(min=1), help="Parallel pg_dump (directory format) and pg_restore jobs for archives, or psql connections loading a plain dump table by table (not used with --stream)")
+@click.option('--compress', is_flag=True, help="Keep the plain dump files zstd-compressed (.zst) between steps; requires zstd")
+@click.option('--copy-freeze', is_flag=True, help="Load table data with COPY ... FREEZE, in the transaction that creates the tables")
+def migrate(cloudsql_password, schema_only, skip_export, skip_clean, source_schema, target_schema, workers, audit_skipped, stream, dump_format, jobs, compress, copy_freeze):
     """Run full migration from CloudSQL to Supabase"""
+    if copy_freeze and dump_format == "plain" and jobs and jobs > 1:
+        raise click.UsageError("--copy-freeze needs the whole dump loaded in one transaction, not with --jobs")
+    if compress and dump_format != "plain":
+        raise click.UsageError("--compress only works with --format plain; archives are compressed by pg_dump")
+    if stream is None:
+        stream = not (skip_export or skip_clean or compress) and dump_format == "plain"
+    elif stream and (skip_export or skip_clean):
+        raise click.UsageError("--stream cannot be combined with --skip-export or --skip-clean")
+    elif stream and dump_format != "plain":
+        raise click.UsageError("--stream only works with --format plain")
+    elif stream and compress:
+        raise click.UsageError("--stream writes no dump files to compress")
     try:
+        if stream:
+            pipeline.stream_migration(
+                password=cloudsql_password,
+                schema_only=schema_only,
+                source_schema=source_schema,
+                target_schema=target_schema,
+                audit_skipped=audit_skipped,
+                copy_freeze=copy_freeze,
+            )
+            click.echo("Migration completed successfully!")
+            return
+
         if not skip_export:
             export.export_cloudsql(
                 password=cloudsql_password, 
                 schema_only=schema_only,
-                schema=source_schema
+                schema=source_schema,
+                dump_format=dump_format,
+                jobs=jobs,
+                compress=compress,
             )
         else:
             logger.info("Skipping export step")
             
+        if dump_format != "plain":
+            # pg_restore --no-owner --no-acl takes care of what cleaning does
+            # for plain dumps; the archive is imported as it is.
+            logger.info(f"{dump_format.capitalize()}-format archive, skipping clean step")
+            import_.import_to_supabase(export.dump_path(dump_format), schema=target_schema, jobs=jobs)
+            click.echo("Migration completed successfully!")
+            return
+
+        cleaned_file = utils.compressed_path(config.CONFIG.cleaned_dump) if compress else None
         if not skip_clean:
-            clean.clean_dump_file(target_schema=target_schema)
+            clean.clean_dump_file(
+                export.dump_path(compress=compress), cleaned_file,
+                target_schema=target_schema, workers=workers, audit_skipped=audit_skipped, copy_freeze=copy_freeze,
+            )
         else:
             logger.info("Skipping clean step")
             
-        import_.import_to_supabase(schema=target_schema)
+        import_.import_to_supabase(cleaned_file, schema=target_schema, jobs=jobs)
         click.echo("Migration completed successfully!")
         
     except Exception as e:
@@ -49,13 +95,21 @@ def migrate(cloudsql_password, schema_only, skip_export, skip_clean, source_sche
 @click.option('--cloudsql-password', help="CloudSQL password (if not provided, will prompt)")
 @click.option('--schema-only', is_flag=True, help="Only export database schema, not data")
 @click.option('--schema', help="Specific schema to export (default: public)")
-def backup(cloudsql_password, schema_only, schema):
+@click.option('--format', 'dump_format', type=click.Choice(export.DUMP_FORMATS), default="plain", show_default=True, help="Plain SQL, or a custom/directory archive for pg_restore")
+@click.option('--jobs', '-j', type=click.IntRange(min=1), help="Parallel pg_dump connections for directory archives [default: PGDUMP_JOBS, capped at the CPU count]")
+@click.option('--compress', is_flag=True, help="Compress a plain dump with zstd into a .zst file")
+def backup(cloudsql_password, schema_only, schema, dump_format, jobs, compress):
     """Only export CloudSQL to a dump file"""
+    if compress and dump_format != "plain":
+        raise click.UsageError("--compress only works with --format plain; archives are compressed by pg_dump")
     try:
         dump_file = export.export_cloudsql(
             password=cloudsql_password, 
             schema_only=schema_only,
-            schema=schema
+            schema=schema,
+            dump_format=dump_format,
+            jobs=jobs,
+            compress=compress,
         )
         click.echo(f"Backup completed successfully! File saved to: {dump_file}")
     except Exception as e:
@@ -64,16 +118,33 @@ def backup(cloudsql_password, schema_only, schema):
         exit(1)
 
 @cli.command()
-@click.option('--input-file', '-i', type=click.Path(exists=True), help="Input SQL dump file")
-@click.option('--output-file', '-o', type=click.Path(), help="Output cleaned SQL file")
+@click.option('--input-file', '-i', type=click.Path(exists=True, allow_dash=True), help="Input SQL dump file, or - for stdin")
+@click.option('--output-file', '-o', type=click.Path(allow_dash=True), help="Output cleaned SQL file, or - for stdout")
 @click.option('--target-schema', help="Target schema in Supabase to import into")
-def clean_dump(input_file, output_file, target_schema):
+@click.option('--workers', type=click.IntRange(min=1), default=1, show_default=True, help="Processes used to clean the dump")
+@click.option('--audit-skipped', is_flag=True, help="Keep lines dropped by the cleaner as SQL comments")
+@click.option('--copy-freeze', is_flag=True, help="Load table data with COPY ... FREEZE; the dump must then be imported in one transaction")
+def clean_dump(input_file, output_file, target_schema, workers, audit_skipped, copy_freeze):
     """Clean a SQL dump file for Supabase compatibility"""
     try:
+        if '-' in (input_file, output_file):
+            # Stream through stdin/stdout; the pool needs a named input file.
+            output_file = output_file or str(config.CONFIG.cleaned_dump)
+            if output_file != '-':
+                Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+            with click.open_file(input_file or str(config.CONFIG.output_dump), 'rb') as infile, \
+                    click.open_file(output_file, 'wb') as outfile:
+                clean.clean_stream(infile, outfile, target_schema, audit_skipped=audit_skipped, copy_freeze=copy_freeze)
+            click.echo("Cleaning completed successfully!", err=True)
+            return
+
         input_path = Path(input_file) if input_file else None
         output_path = Path(output_file) if output_file else None
         
-        result_file = clean.clean_dump_file(input_path, output_path, target_schema)
+        result_file = clean.clean_dump_file(
+            input_path, output_path, target_schema, workers=workers, audit_skipped=audit_skipped,
+            copy_freeze=copy_freeze,
+        )
         click.echo(f"Cleaning completed successfully! File saved to: {result_file}")
     except Exception as e:
         logger.error(f"Cleaning failed: {str(e)}")
@@ -83,11 +154,12 @@ def clean_dump(input_file, output_file, target_schema):
 @cli.command()
 @click.option('--input-file', '-i', type=click.Path(exists=True), help="Input SQL dump file to import")
 @click.option('--schema', help="Target schema in Supabase to import into")
-def import_db(input_file, schema):
+@click.option('--jobs', '-j', type=click.IntRange(min=1), help="Parallel pg_restore jobs for archives [default: one per CPU], or psql connections loading a plain dump table by table [default: 1]")
+def import_db(input_file, schema, jobs):
     """Import a cleaned SQL dump file into Supabase"""
     try:
         input_path = Path(input_file) if input_file else None
-        import_.import_to_supabase(input_path, schema=schema)
+        import_.import_to_supabase(input_path, schema=schema, jobs=jobs)
         click.echo("Import completed successfully!")
     except Exception as e:
         logger.error(f"Import failed: {str(e)}")
@@ -103,11 +175,12 @@ def validate():
         
         
         click.echo("\nCurrent configuration:")
-        click.echo(f"CloudSQL: {config.CLOUDSQL_USER}@{config.CLOUDSQL_HOST}:{config.CLOUDSQL_PORT}/{config.CLOUDSQL_DB}")
-        click.echo(f"Supabase: {config.SUPABASE_USER}@{config.SUPABASE_HOST}:{config.SUPABASE_PORT}/{config.SUPABASE_DB}")
-        click.echo(f"Output directory: {config.OUTPUT_DIR}")
-        click.echo(f"Dump file: {config.OUTPUT_DUMP}")
-        click.echo(f"Cleaned dump file: {config.CLEANED_DUMP}")
+        cfg = config.CONFIG
+        click.echo(f"CloudSQL: {cfg.cloudsql_user}@{cfg.cloudsql_host}:{cfg.cloudsql_port}/{cfg.cloudsql_db}")
+        click.echo(f"Supabase: {cfg.supabase_user}@{cfg.supabase_host}:{cfg.supabase_port}/{cfg.supabase_db}")
+        click.echo(f"Output directory: {cfg.output_dir}")
+        click.echo(f"Dump file: {cfg.output_dump}")
+        click.echo(f"Cleaned dump file: {cfg.cleaned_dump}")
         
     except Exception as e:
         click.echo(f"Configuration error: {str(e)}", err=True)
@@ -1,5 +1,8 @@
+import functools
 import os
+from dataclasses import dataclass, fields
 from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
 import logging
 
@@ -14,45 +17,104 @@ logger = logging.getLogger('cloudsql_to_supabase')
 load_dotenv()
 
 
-CLOUDSQL_USER = os.getenv("CLOUDSQL_USER")
-CLOUDSQL_HOST = os.getenv("CLOUDSQL_HOST")
-CLOUDSQL_DB = os.getenv("CLOUDSQL_DB")
-CLOUDSQL_PORT = int(os.getenv("CLOUDSQL_PORT", 5432))
-CLOUDSQL_SSL_MODE = os.getenv("CLOUDSQL_SSL_MODE", "prefer")
-CLOUDSQL_SCHEMA = os.getenv("CLOUDSQL_SCHEMA", "public")
+@dataclass(frozen=True)
+class Config:
+    """
+    Settings read from the environment (and .env) once, at import.
 
-SUPABASE_USER = os.getenv("SUPABASE_USER", "postgres")
-SUPABASE_HOST = os.getenv("SUPABASE_HOST")
-SUPABASE_DB = os.getenv("SUPABASE_DB", "postgres")
-SUPABASE_PASSWORD = os.getenv("SUPABASE_PASSWORD")
-SUPABASE_PORT = int(os.getenv("SUPABASE_PORT", 5432))
-SUPABASE_SSL_MODE = os.getenv("SUPABASE_SSL_MODE", "require")
+    Each field is read from the environment variable of the same name in
+    upper case. Use the CONFIG instance, looked up at call time as
+    ``config.CONFIG`` so that reload() is picked up.
+    """
 
-"""
-    Adjust this to match your target schema, in my case I was trying to use development schema in database
-"""
-SUPABASE_SCHEMA = os.getenv("SUPABASE_SCHEMA", "development") 
+    cloudsql_user: Optional[str]
+    cloudsql_host: Optional[str]
+    cloudsql_db: Optional[str]
+    cloudsql_port: int
+    cloudsql_ssl_mode: str
+    cloudsql_schema: str
 
+    supabase_user: str
+    supabase_host: Optional[str]
+    supabase_db: str
+    supabase_password: Optional[str]
+    supabase_port: int
+    supabase_ssl_mode: str
+    # Adjust this to match your target schema, in my case I was trying to use
+    # development schema in database
+    supabase_schema: str
 
-OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR", "."))
-OUTPUT_DUMP = OUTPUT_DIR / os.getenv("OUTPUT_DUMP", "backup.sql")
-CLEANED_DUMP = OUTPUT_DIR / os.getenv("CLEANED_DUMP", "cleaned_backup.sql")
+    # Parallel pg_dump connections for directory-format exports.
+    pgdump_jobs: int
 
+    output_dir: Path
+    output_dump: Path
+    cleaned_dump: Path
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        output_dir = Path(os.getenv("OUTPUT_DIR", "."))
+        return cls(
+            cloudsql_user=os.getenv("CLOUDSQL_USER"),
+            cloudsql_host=os.getenv("CLOUDSQL_HOST"),
+            cloudsql_db=os.getenv("CLOUDSQL_DB"),
+            cloudsql_port=int(os.getenv("CLOUDSQL_PORT", 5432)),
+            cloudsql_ssl_mode=os.getenv("CLOUDSQL_SSL_MODE", "prefer"),
+            cloudsql_schema=os.getenv("CLOUDSQL_SCHEMA", "public"),
+            supabase_user=os.getenv("SUPABASE_USER", "postgres"),
+            supabase_host=os.getenv("SUPABASE_HOST"),
+            supabase_db=os.getenv("SUPABASE_DB", "postgres"),
+            supabase_password=os.getenv("SUPABASE_PASSWORD"),
+            supabase_port=int(os.getenv("SUPABASE_PORT", 5432)),
+            supabase_ssl_mode=os.getenv("SUPABASE_SSL_MODE", "require"),
+            supabase_schema=os.getenv("SUPABASE_SCHEMA", "development"),
+            pgdump_jobs=int(os.getenv("PGDUMP_JOBS", 4)),
+            output_dir=output_dir,
+            output_dump=output_dir / os.getenv("OUTPUT_DUMP", "backup.sql"),
+            cleaned_dump=output_dir / os.getenv("CLEANED_DUMP", "cleaned_backup.sql"),
+        )
+
+    @classmethod
+    def reload(cls) -> "Config":
+        """Re-read the environment into a new CONFIG, e.g. after changing it in tests."""
+        global CONFIG
+        CONFIG = cls.from_env()
+        _validate.cache_clear()
+        return CONFIG
+
+
+CONFIG = Config.from_env()
+
+# Fields that have no usable default and must be set in the environment.
+_REQUIRED_FIELDS = frozenset({
+    "cloudsql_user",
+    "cloudsql_host",
+    "cloudsql_db",
+    "supabase_host",
+    "supabase_password",
+})
+
+
+@functools.lru_cache(maxsize=1)
+def _validate(cfg: Config) -> None:
+    missing = [
+        field.name.upper()
+        for field in fields(cfg)
+        if field.name in _REQUIRED_FIELDS and not getattr(cfg, field.name)
+    ]
 
-def validate_config():
-    """Validate that the required environment variables are set."""
-    required_vars = {
-        "CLOUDSQL_USER": CLOUDSQL_USER,
-        "CLOUDSQL_HOST": CLOUDSQL_HOST,
-        "CLOUDSQL_DB": CLOUDSQL_DB,
-        "SUPABASE_HOST": SUPABASE_HOST,
-        "SUPABASE_PASSWORD": SUPABASE_PASSWORD,
-    }
-    
-    missing = [var for var, value in required_vars.items() if not value]
-    
     if missing:
         raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
-    
-    
-    OUTPUT_DIR.mkdir(exist_ok=True)
+
+
+    cfg.output_dir.mkdir(exist_ok=True)
+
+
+def validate_config():
+    """
+    Validate that the required environment variables are set.
+
+    The CLI commands and the steps they run each validate, so the result is
+    cached for the current CONFIG; a failed validation is not cached.
+    """
+    _validate(CONFIG)
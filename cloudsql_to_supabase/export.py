@@ -1,57 +1,140 @@
 from pathlib import Path
+import functools
 import getpass
 import os
+import shutil
 import logging
+from typing import Dict, List, Optional, Tuple
 from . import config, utils
 
 logger = logging.getLogger('cloudsql_to_supabase.export')
 
-def export_cloudsql(password: str = None, schema_only: bool = False, schema: str = None) -> Path:
+# pg_dump output formats: plain SQL, which the cleaner can rewrite, or the
+# archives pg_restore can load in parallel: a single compressed custom-format
+# file, or a directory that pg_dump can also write in parallel.
+DUMP_FORMATS = ("plain", "custom", "directory")
+_FORMAT_FLAGS = {"plain": ["-F", "p"], "custom": ["-F", "c", "-Z", "6"], "directory": ["-F", "d"]}
+
+
+def dump_path(dump_format: str = "plain", compress: bool = False) -> Path:
+    """Where export_cloudsql writes a dump of the given format."""
+    if dump_format == "custom":
+        return Path(config.CONFIG.output_dump).with_suffix(".dump")
+    if dump_format == "directory":
+        return Path(config.CONFIG.output_dump).with_suffix(".d")
+    if compress:
+        return utils.compressed_path(config.CONFIG.output_dump)
+    return Path(config.CONFIG.output_dump)
+
+
+@functools.lru_cache(maxsize=1)
+def _pg_dump_base(cfg: config.Config) -> Tuple[str, ...]:
+    """The pg_dump argv up to the format flags, built once per configuration."""
+    return (
+        "pg_dump",
+        "-U", cfg.cloudsql_user,
+        "-h", cfg.cloudsql_host,
+        "-p", str(cfg.cloudsql_port),
+        "-d", cfg.cloudsql_db,
+    )
+
+
+def default_jobs() -> int:
+    """Parallel pg_dump connections: PGDUMP_JOBS, capped at the CPU count."""
+    return max(1, min(os.cpu_count() or 1, config.CONFIG.pgdump_jobs))
+
+
+def build_pg_dump_command(
+    schema: str,
+    schema_only: bool = False,
+    output_file: Optional[Path] = None,
+    dump_format: str = "plain",
+    jobs: int = 1,
+) -> List[str]:
     """
-    Export a CloudSQL PostgreSQL database to a dump file.
-    
+    Build the pg_dump argv for the CloudSQL database.
+
     Args:
-        password: CloudSQL database password. If None, will prompt.
+        schema: Schema to export.
         schema_only: If True, only export schema, not data
-        schema: Specific schema to export. If None, uses the one from config
-        
-    Returns:
-        Path to the created dump file
+        output_file: File to write the dump to. If None, pg_dump writes it to stdout.
+        dump_format: "plain" SQL, or a "custom" or "directory" archive.
+        jobs: Tables dumped in parallel; only used for directory archives.
     """
-    config.validate_config()
-    schema = schema or config.CLOUDSQL_SCHEMA
-    logger.info(f"Starting export from CloudSQL database: {config.CLOUDSQL_DB}, schema: {schema}")
-    
+    argv = [*_pg_dump_base(config.CONFIG), *_FORMAT_FLAGS[dump_format]]
     
-    cmd_parts = [
-        f"pg_dump -U {config.CLOUDSQL_USER}",
-        f"-h {config.CLOUDSQL_HOST}",
-        f"-p {config.CLOUDSQL_PORT}",
-        f"-d {config.CLOUDSQL_DB}",
-        "-F p",  
-    ]
+    if dump_format == "directory" and jobs > 1:
+        argv += ["-j", str(jobs)]
     
     
     if schema != "public":
-        cmd_parts.append(f"-n {schema}")
+        argv += ["-n", schema]
     
     if schema_only:
-        cmd_parts.append("--schema-only")
+        argv.append("--schema-only")
     
-    cmd_parts.append(f"-f {config.OUTPUT_DUMP}")
-    cmd = " ".join(cmd_parts)
+    if output_file is not None:
+        argv += ["-f", str(output_file)]
+    return argv
+
+
+def cloudsql_env(password: Optional[str] = None) -> Dict[str, str]:
+    """Environment for CloudSQL client commands; prompts for the password if None."""
+    if password is None:
+        password = getpass.getpass("Enter Cloud SQL password: ")
+    cfg = config.CONFIG
+    env = utils.pgpass_env(cfg.cloudsql_host, cfg.cloudsql_port, cfg.cloudsql_db, cfg.cloudsql_user, password)
+    env["PGSSLMODE"] = cfg.cloudsql_ssl_mode
+    return env
+
+
+def export_cloudsql(
+    password: str = None,
+    schema_only: bool = False,
+    schema: str = None,
+    dump_format: str = "plain",
+    jobs: Optional[int] = None,
+    compress: bool = False,
+) -> Path:
+    """
+    Export a CloudSQL PostgreSQL database to a dump file.
     
+    Args:
+        password: CloudSQL database password. If None, will prompt.
+        schema_only: If True, only export schema, not data
+        schema: Specific schema to export. If None, uses the one from config
+        dump_format: "plain" SQL, or a "custom"/"directory" archive for parallel pg_restore
+        jobs: Parallel pg_dump connections for directory archives. If None, uses PGDUMP_JOBS
+        compress: Pipe a plain dump through zstd into a .zst file
+        
+    Returns:
+        Path to the created dump file
+    """
+    config.validate_config()
+    schema = schema or config.CONFIG.cloudsql_schema
+    logger.info(f"Starting export from CloudSQL database: {config.CONFIG.cloudsql_db}, schema: {schema}")
     
-    env = os.environ.copy()
-    if password is None:
-        env['PGPASSWORD'] = getpass.getpass("Enter Cloud SQL password: ")
-    else:
-        env['PGPASSWORD'] = password
+    if compress and dump_format != "plain":
+        raise ValueError("Only plain dumps can be compressed with zstd; archives are compressed by pg_dump")
+    output_file = dump_path(dump_format, compress)
+    free_bytes = shutil.disk_usage(config.CONFIG.output_dir).free
+    logger.info(f"Free space in {config.CONFIG.output_dir}: {free_bytes / 2**30:.1f} GiB")
+    if dump_format == "directory" and (output_file / "toc.dat").exists():
+        # pg_dump refuses to write into a non-empty directory; replace the
+        # archive left by a previous export.
+        logger.info(f"Removing previous directory archive {output_file}")
+        shutil.rmtree(output_file)
+    env = cloudsql_env(password)
     
     try:
-        utils.run_command(cmd, env)
-        logger.info(f"Export completed successfully, saved to {config.OUTPUT_DUMP}")
-        return Path(config.OUTPUT_DUMP)
+        if compress:
+            cmd = build_pg_dump_command(schema, schema_only, dump_format=dump_format)
+            utils.run_pipeline([cmd, utils.zstd_compress_command(output_file)], env)
+        else:
+            cmd = build_pg_dump_command(schema, schema_only, output_file, dump_format, jobs or default_jobs())
+            utils.run_command(cmd, env)
+        logger.info(f"Export completed successfully, saved to {output_file}")
+        return output_file
     except Exception as e:
         logger.error(f"Export failed: {e}")
         raise
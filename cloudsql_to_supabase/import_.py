@@ -1,67 +1,194 @@
+import functools
 import os
 import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional
-from . import config, utils
+from typing import Dict, List, Optional, Tuple
+from . import clean, config, utils
 
 logger = logging.getLogger('cloudsql_to_supabase.import')
 
-def import_to_supabase(input_file: Optional[Path] = None, password: Optional[str] = None, schema: Optional[str] = None) -> None:
+def supabase_env(password: Optional[str] = None) -> Dict[str, str]:
+    """Environment for Supabase client commands; the password defaults to the one from config."""
+    cfg = config.CONFIG
+    env = utils.pgpass_env(
+        cfg.supabase_host, cfg.supabase_port, cfg.supabase_db, cfg.supabase_user,
+        password or cfg.supabase_password,
+    )
+    env["PGSSLMODE"] = cfg.supabase_ssl_mode
+    return env
+
+
+@functools.lru_cache(maxsize=1)
+def _connection_args(cfg: config.Config) -> Tuple[str, ...]:
+    return (
+        "-h", cfg.supabase_host,
+        "-p", str(cfg.supabase_port),
+        "-U", cfg.supabase_user,
+        "-d", cfg.supabase_db,
+    )
+
+
+def _supabase_connection_args() -> Tuple[str, ...]:
+    """Connection options of the Supabase client commands, built once per configuration."""
+    return _connection_args(config.CONFIG)
+
+
+def _quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def build_psql_command(target_schema: str, dump_file: Optional[Path] = None) -> List[str]:
+    """
+    Build the psql argv that loads a cleaned dump in a single transaction.
+
+    For a schema other than public, the same session first creates the schema
+    and points search_path at it, so no second connection is needed and the
+    schema is rolled back with the data if the load fails.
+
+    Args:
+        target_schema: Target schema to import into.
+        dump_file: Cleaned dump to load. If None, psql reads it from stdin.
+    """
+    argv = [
+        "psql",
+        *_supabase_connection_args(),
+        "--set", "ON_ERROR_STOP=on",
+        "--single-transaction",
+    ]
+
+
+    if target_schema != "public":
+        schema = _quote_ident(target_schema)
+        argv += ["-c", f"CREATE SCHEMA IF NOT EXISTS {schema}; SET search_path TO {schema}, public;"]
+
+
+    argv += ["-f", "-" if dump_file is None else str(dump_file)]
+    return argv
+
+
+def archive_format(dump_file: Path) -> Optional[str]:
+    """
+    Detect a pg_dump archive: "custom" or "directory", or None for plain SQL.
+
+    Custom-format files start with the ``PGDMP`` magic; directory archives
+    hold a ``toc.dat``.
+    """
+    if dump_file.is_dir():
+        return "directory" if (dump_file / "toc.dat").exists() else None
+    with open(dump_file, 'rb') as f:
+        return "custom" if f.read(5) == b'PGDMP' else None
+
+
+def build_pg_restore_command(dump_file: Path, jobs: int) -> List[str]:
+    """
+    Build the pg_restore argv that loads an archive over ``jobs`` connections.
+
+    Ownership and privileges are left out, as the CloudSQL roles they name do
+    not exist on Supabase. Parallel restore cannot run in a single
+    transaction, so the restore stops at the first error instead.
+    """
+    return [
+        "pg_restore",
+        *_supabase_connection_args(),
+        "--no-owner", "--no-acl", "--exit-on-error",
+        f"--jobs={jobs}",
+        str(dump_file),
+    ]
+
+
+def load_tables_in_parallel(dump_file: Path, target_schema: str, env: Dict[str, str], jobs: int) -> None:
+    """
+    Load a plain-format dump over ``jobs`` psql connections, one table at a time.
+
+    The dump is split with clean.split_dump_by_table. The schema is loaded
+    first, then the table data in parallel, largest first, and finally the
+    constraints and indexes, which is also where foreign keys are checked.
+    Each file is its own transaction, so unlike a single psql load, a failure
+    leaves the tables loaded so far in place.
+
+    Raises:
+        RuntimeError: If any of the files fails to load.
+    """
+    with tempfile.TemporaryDirectory(prefix="split-", dir=config.CONFIG.output_dir) as split_dir:
+        pre_data, data, post_data = clean.split_dump_by_table(dump_file, Path(split_dir))
+        utils.run_command(build_psql_command(target_schema, pre_data), env)
+
+        logger.info(f"Loading {len(data)} tables over {jobs} connections")
+        data.sort(key=lambda path: path.stat().st_size, reverse=True)
+        failures, not_loaded = [], []
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                pool.submit(utils.run_command, build_psql_command(target_schema, path), env): path
+                for path in data
+            }
+            for future in as_completed(futures):
+                if future.cancelled():
+                    not_loaded.append(futures[future].name)
+                    continue
+                try:
+                    future.result()
+                except Exception as e:
+                    failures.append(f"{futures[future].name}: {e}")
+                    # Tables not started yet are left for a rerun.
+                    for pending in futures:
+                        pending.cancel()
+        if failures:
+            message = f"{len(failures)} table data file(s) failed to load:\n" + "\n".join(failures)
+            if not_loaded:
+                message += f"\n{len(not_loaded)} not loaded, rerun needed: " + ", ".join(sorted(not_loaded))
+            raise RuntimeError(message)
+
+        utils.run_command(build_psql_command(target_schema, post_data), env)
+
+
+def import_to_supabase(
+    input_file: Optional[Path] = None,
+    password: Optional[str] = None,
+    schema: Optional[str] = None,
+    jobs: Optional[int] = None,
+) -> None:
     """
     Import a cleaned SQL dump file into Supabase
 
+    A zstd-compressed dump (.zst) is decompressed into psql's stdin. With
+    more than one job, a plain dump is instead loaded table by table over
+    parallel connections, see load_tables_in_parallel. Custom- and
+    directory-format archives are detected and restored with pg_restore;
+    they keep the schemas they were dumped from, and a ``schema`` given for
+    one is ignored with a warning.
+
     Args:
         input_file: Path to the SQL dump file to import. If None, uses the default.
         password: Supabase database password. If None, uses from config.
         schema: Target schema to import into. If None, uses the one from config.
+        jobs: Parallel pg_restore jobs for archives (if None, one per CPU), or
+            psql connections for a plain dump (if None, a single one).
     """
     config.validate_config()
-    dump_file = input_file or Path(config.CLEANED_DUMP)
+    dump_file = input_file or Path(config.CONFIG.cleaned_dump)
     target_schema = schema or 'development'
 
     if not dump_file.exists():
         raise FileNotFoundError(f"Dump file not found: {dump_file}")
 
-    logger.info(f"Importing file {dump_file} into Supabase database: {config.SUPABASE_DB}, schema: {target_schema}")
-
-    
-    env = os.environ.copy()
-    env['PGPASSWORD'] = password or config.SUPABASE_PASSWORD
-
-    
-    if target_schema != "public":
-        create_schema_cmd = (
-            f"psql -h {config.SUPABASE_HOST} "
-            f"-p {config.SUPABASE_PORT} "
-            f"-U {config.SUPABASE_USER} "
-            f"-d {config.SUPABASE_DB} "
-            f"-c \"CREATE SCHEMA IF NOT EXISTS {target_schema};\""
-        )
-        try:
-            logger.info(f"Creating schema if it doesn't exist: {target_schema}")
-            utils.run_command(create_schema_cmd, env)
-        except Exception as e:
-            logger.warning(f"Failed to create schema, it may already exist: {e}")
-
-    
-    cmd = (
-        f"psql -h {config.SUPABASE_HOST} "
-        f"-p {config.SUPABASE_PORT} "
-        f"-U {config.SUPABASE_USER} "
-        f"-d {config.SUPABASE_DB} "
-        f"--set ON_ERROR_STOP=on "
-        f"--single-transaction "
-    )
-
-    
-    if target_schema != "public":
-        cmd += f"--set search_path={target_schema} "
-
-    
-    cmd += f"-f {dump_file} "
+    logger.info(f"Importing file {dump_file} into Supabase database: {config.CONFIG.supabase_db}, schema: {target_schema}")
 
+    env = supabase_env(password)
     try:
-        utils.run_command(cmd, env)
+        if utils.is_compressed(dump_file):
+            utils.run_pipeline([utils.zstd_decompress_command(dump_file), build_psql_command(target_schema)], env)
+        elif archive_format(dump_file) is not None:
+            if schema is not None:
+                logger.warning(
+                    f"Ignoring schema {schema}: pg_restore restores an archive into the schemas it was dumped from"
+                )
+            utils.run_command(build_pg_restore_command(dump_file, jobs or os.cpu_count() or 1), env)
+        elif jobs and jobs > 1:
+            load_tables_in_parallel(dump_file, target_schema, env, jobs)
+        else:
+            utils.run_command(build_psql_command(target_schema, dump_file), env)
         logger.info("Import completed successfully")
     except Exception as e:
         logger.error(f"Import failed: {e}")
@@ -0,0 +1,71 @@
+import logging
+import shlex
+import subprocess
+from typing import Optional
+from . import clean, config, export, import_, utils
+
+logger = logging.getLogger('cloudsql_to_supabase.pipeline')
+
+def stream_migration(
+    password: Optional[str] = None,
+    schema_only: bool = False,
+    source_schema: Optional[str] = None,
+    target_schema: Optional[str] = None,
+    audit_skipped: bool = False,
+    copy_freeze: bool = False,
+) -> None:
+    """
+    Migrate from CloudSQL to Supabase without intermediate dump files.
+
+    pg_dump writes the dump to a pipe, this process cleans it on the fly and
+    feeds the result to psql's stdin, so the three stages run concurrently.
+    psql loads the dump in a single transaction; if anything upstream fails it
+    is killed before it sees the end of its input, so nothing is committed.
+
+    Args:
+        password: CloudSQL database password. If None, will prompt.
+        schema_only: If True, only migrate the schema, not data
+        source_schema: Schema to export. If None, uses the one from config
+        target_schema: Schema to import into.
+        audit_skipped: Keep each line dropped by the cleaner as a SQL comment.
+        copy_freeze: Load table data with COPY ... FREEZE.
+    """
+    config.validate_config()
+    source_schema = source_schema or config.CONFIG.cloudsql_schema
+    import_schema = target_schema or 'development'
+
+    dump_cmd = export.build_pg_dump_command(source_schema, schema_only)
+    dump_env = export.cloudsql_env(password)
+    restore_cmd = import_.build_psql_command(import_schema)
+    restore_env = import_.supabase_env()
+
+    logger.info(f"Streaming: {shlex.join(dump_cmd)} | clean | {shlex.join(restore_cmd)}")
+    dump = utils.spawn(dump_cmd, dump_env, stdout=subprocess.PIPE)
+    try:
+        restore = utils.spawn(restore_cmd, restore_env, stdin=subprocess.PIPE)
+    except Exception:
+        dump.kill()
+        dump.wait()
+        raise
+
+    try:
+        clean.clean_stream(
+            dump.stdout, restore.stdin,
+            target_schema=target_schema, audit_skipped=audit_skipped, copy_freeze=copy_freeze,
+        )
+        dump.stdout.close()
+        if dump.wait() != 0:
+            raise RuntimeError(f"pg_dump failed with exit code {dump.returncode}")
+        restore.stdin.close()
+        if restore.wait() != 0:
+            raise RuntimeError(f"psql failed with exit code {restore.returncode}")
+    except BaseException as e:
+        for process in (dump, restore):
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+        if isinstance(e, BrokenPipeError):
+            raise RuntimeError(f"psql exited early with exit code {restore.returncode}") from e
+        raise
+
+    logger.info("Streaming migration completed successfully")
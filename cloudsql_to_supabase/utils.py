@@ -1,85 +1,520 @@
+import atexit
+import contextlib
+import functools
+import json
+import os
+import selectors
 import subprocess
 import shlex
-from typing import Dict, Optional, List, Union
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, List, Sequence, Tuple, Union
 import logging
 import sys 
 
+try:
+    import orjson
+except ImportError:  # orjson is optional, see the "orjson" extra
+    orjson = None
+
 logger = logging.getLogger('cloudsql_to_supabase.utils')
 
-if not logger.hasHandlers():
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_logging_configured = False
+
+
+def _ensure_logging() -> None:
+    """
+    Set up basic logging the first time a command is run, if nothing has.
+
+    Done on first use rather than at import, so importing this module for
+    its helpers neither costs a handler nor overrides the logging setup of
+    the application importing it.
+    """
+    global _logging_configured
+    if _logging_configured:
+        return
+    if not logger.hasHandlers():
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    _logging_configured = True
+
+# Variables passed on to client commands besides the PG*/LC_* ones: where
+# libpq and its libraries are loaded from (conda, Postgres.app), Kerberos
+# credentials for GSS authentication, CA certificates, and what Windows needs
+# to start processes and libpq to find its files there. More can be added,
+# comma-separated, in ENV_PASSTHROUGH.
+_ENV_PASSTHROUGH = frozenset({
+    "PATH", "HOME", "LANG", "TMPDIR", "TZ",
+    "LD_LIBRARY_PATH", "DYLD_LIBRARY_PATH", "DYLD_FALLBACK_LIBRARY_PATH",
+    "KRB5CCNAME", "KRB5_CONFIG", "KRB5_KTNAME",
+    "SSL_CERT_FILE", "SSL_CERT_DIR",
+    "SYSTEMROOT", "TEMP", "TMP", "PATHEXT", "APPDATA", "USERPROFILE",
+})
+
+# Private pgpass file shared by all client commands of this process.
+_pgpass_path: Optional[Path] = None
+_pgpass_entries: Dict[Tuple[str, str, str, str], str] = {}
+
+
+def _pgpass_escape(value: object) -> str:
+    return str(value).replace('\\', '\\\\').replace(':', '\\:')
+
+
+def _remove_pgpass() -> None:
+    if _pgpass_path is not None:
+        _pgpass_path.unlink(missing_ok=True)
+
+
+def pgpass_env(host: str, port: int, dbname: str, user: str, password: Optional[str]) -> Dict[str, str]:
+    """
+    Environment for a libpq client command that authenticates through a pgpass file.
 
-def run_command(cmd: str, env: Optional[Dict] = None, show_output: bool = True, progress_char: str = ".") -> None:
+    The password is added to a pgpass file private to this process (mode 0600,
+    removed at exit) rather than put in PGPASSWORD, where every descendant
+    process inherits it. Only the PG* and LC_* settings of our own
+    environment are passed on, with the variables in ``_ENV_PASSTHROUGH``
+    (path, locale, library path, Kerberos, CA certificates, ...) and those
+    named in the comma-separated ENV_PASSTHROUGH variable.
+    """
+    global _pgpass_path
+    if _pgpass_path is None:
+        fd, name = tempfile.mkstemp(prefix="pg_migrate_", suffix=".pgpass")
+        os.close(fd)
+        _pgpass_path = Path(name)
+        atexit.register(_remove_pgpass)
+    if password is not None:
+        _pgpass_entries[(host, str(port), dbname, user)] = password
+        _pgpass_path.write_text("".join(
+            ":".join(_pgpass_escape(field) for field in (*key, secret)) + "\n"
+            for key, secret in _pgpass_entries.items()
+        ))
+
+    passthrough = _ENV_PASSTHROUGH.union(filter(None, (
+        name.strip() for name in os.getenv("ENV_PASSTHROUGH", "").split(",")
+    )))
+    env = {
+        key: value for key, value in os.environ.items()
+        if key in passthrough
+        or (key.startswith(("PG", "LC_")) and key not in ("PGPASSWORD", "PGPASSFILE"))
+    }
+    env["PGPASSFILE"] = str(_pgpass_path)
+    return env
+
+
+@functools.lru_cache(maxsize=256)
+def _split(cmd: str) -> Tuple[str, ...]:
+    """shlex.split, memoized for command strings that are run repeatedly."""
+    return tuple(shlex.split(cmd))
+
+
+def _redact(text: str, env: Optional[Dict]) -> str:
+    """Mask the PGPASSWORD of ``env``, if any, wherever it appears in ``text``."""
+    secret = env.get("PGPASSWORD") if env else None
+    # Passwords normally live in the pgpass file, so this is almost always
+    # just the substring test.
+    if not secret or secret not in text:
+        return text
+    return text.replace(secret, "********")
+
+
+@functools.lru_cache(maxsize=64)
+def _which(name: str, path: Optional[str]) -> str:
+    """The full path of command ``name`` on ``path``, or ``name`` itself if not found."""
+    return shutil.which(name, path=path) or name
+
+
+def spawn(args: Sequence[str], env: Optional[Dict] = None, **kwargs) -> subprocess.Popen:
+    """
+    subprocess.Popen for a client command, started with posix_spawn where possible.
+
+    Popen only uses posix_spawn, which does not copy this process's page
+    tables the way fork does, when it is given the full path of the program
+    and need not close inherited file descriptors. The program is therefore
+    looked up on the PATH of ``env`` here, once per name, and close_fds is
+    off: the descriptors Python opens, pipes included, are not inheritable
+    anyway.
+    """
+    path = (env if env is not None else os.environ).get("PATH")
+    kwargs.setdefault("close_fds", False)
+    return subprocess.Popen(args, executable=_which(args[0], path), env=env, **kwargs)
+
+
+# Passed to the logger with the command as an argument, so the message is
+# only formatted when INFO is enabled.
+_RUNNING_FORMAT = "Running command: %s"
+_SUCCEEDED_FORMAT = "Command '%s' executed successfully."
+
+
+# Size of the reads of a captured command's output.
+_OUTPUT_CHUNK = 1 << 16
+
+# How much of a command's stderr is kept for error reporting: its end, which
+# is where the reason it failed is.
+_STDERR_TAIL = 1 << 16
+
+
+def _read_pipe(pipe: BinaryIO, handler: Callable[[memoryview], None]) -> None:
+    """Pass what arrives on ``pipe`` to ``handler`` until EOF, reading into one buffer."""
+    buffer = memoryview(bytearray(_OUTPUT_CHUNK))
+    while True:
+        size = pipe.readinto1(buffer)
+        if not size:
+            break
+        handler(buffer[:size])
+
+
+def _drain(
+    process: subprocess.Popen,
+    on_stdout: Callable[[memoryview], None],
+    on_stderr: Optional[Callable[[memoryview], None]] = None,
+) -> bytes:
+    """
+    Read a command's stdout (if piped) and stderr as data arrives on either.
+
+    Reading them one after the other can deadlock: the command blocks on a
+    full stderr pipe while we wait for its stdout to end. Each chunk of
+    stdout, and of stderr if ``on_stderr`` is given, is passed on as a view
+    of a buffer that is reused for the next read; the last ``_STDERR_TAIL``
+    bytes of stderr are returned, so a command spewing errors cannot exhaust
+    memory.
+    """
+    stderr_tail = bytearray()
+
+    def keep_stderr(chunk: memoryview) -> None:
+        if on_stderr is not None:
+            on_stderr(chunk)
+        stderr_tail.extend(chunk)
+        del stderr_tail[:-_STDERR_TAIL]
+
+    if sys.platform == "win32":
+        # select() only takes sockets there; read stderr from a thread instead.
+        reader = threading.Thread(target=_read_pipe, args=(process.stderr, keep_stderr), daemon=True)
+        reader.start()
+        if process.stdout:
+            _read_pipe(process.stdout, on_stdout)
+        reader.join()
+        return bytes(stderr_tail)
+
+    handlers = {process.stderr.fileno(): keep_stderr}
+    if process.stdout:
+        handlers[process.stdout.fileno()] = on_stdout
+    buffer = bytearray(_OUTPUT_CHUNK)
+    view = memoryview(buffer)
+    with selectors.DefaultSelector() as selector:
+        for fd in handlers:
+            selector.register(fd, selectors.EVENT_READ)
+        while selector.get_map():
+            for key, _ in selector.select():
+                size = os.readv(key.fd, [buffer])
+                if size:
+                    handlers[key.fd](view[:size])
+                else:
+                    selector.unregister(key.fd)
+    return bytes(stderr_tail)
+
+
+# Command output shown by run_command is written to stderr directly rather
+# than as log records, which would take the logging lock and format a time
+# for every chunk. Each chunk of lines gets a prefix in the format of the
+# records, whose time is only refreshed once a second: INFO for stdout,
+# WARNING for stderr, as the diagnostics of pg_dump and psql were logged.
+_STREAM_LEVELS = {"stdout": "INFO", "stderr": "WARNING"}
+_stream_time = ""
+_stream_time_expires = 0.0
+
+
+def _write_output(text: str, stream: str = "stdout") -> None:
+    """Write lines of command output to stderr under the current prefix."""
+    global _stream_time, _stream_time_expires
+    now = time.monotonic()
+    if now >= _stream_time_expires:
+        _stream_time = time.strftime("%Y-%m-%d %H:%M:%S")
+        _stream_time_expires = now + 1
+    sys.stderr.write(f"{_stream_time} - {logger.name} - {_STREAM_LEVELS[stream]} - {text}\n")
+
+
+def _json_line(record: Dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(record).decode()
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def _write_json_output(text: str, cmd: str, stream: str = "stdout") -> None:
+    """
+    Write lines of command output to stderr as JSON objects, one per line.
+
+    Used when LOG_JSON is set, for CI jobs that parse the output: each line
+    becomes ``{"t": <unix time>, "cmd": <command>, "stream": <"stdout" or
+    "stderr">, "line": <text>}``.
+    """
+    t = time.time()
+    sys.stderr.write("".join(
+        _json_line({"t": t, "cmd": cmd, "stream": stream, "line": line}) + "\n" for line in text.split("\n")
+    ))
+
+
+def _discard(chunk: memoryview) -> None:
+    pass
+
+
+def _line_writer(write: Callable[[str], None]) -> Tuple[Callable[[memoryview], None], Callable[[], None]]:
+    """
+    Split chunks of command output into lines for ``write``.
+
+    Returns ``(feed, flush)``: ``feed`` passes the complete lines of what has
+    arrived so far to ``write`` at once, keeping a partial last line for the
+    next chunk; ``flush`` writes that line at the end of the output.
+    """
+    pending = bytearray()
+
+    def feed(chunk: memoryview) -> None:
+        pending.extend(chunk)
+        cut = pending.rfind(b"\n") + 1
+        if cut:
+            with memoryview(pending) as lines:
+                write(str(lines[:cut], errors="replace").rstrip("\n"))
+            del pending[:cut]
+
+    def flush() -> None:
+        if pending:
+            write(pending.decode(errors="replace").rstrip("\n"))
+            pending.clear()
+
+    return feed, flush
+
+
+def run_command(
+    cmd: Union[str, Sequence[str]],
+    env: Optional[Dict] = None,
+    show_output: bool = True,
+    progress_char: str = ".",
+    capture: bool = False,
+) -> None:
     """
     Run a shell command safely with proper logging and real-time output streaming
     that can act as a progress indicator.
 
+    By default the command writes its stdout straight to ours, so output never
+    passes through Python. Its stderr is shown as it arrives, under a prefix
+    like that of a log record or as JSON lines if the LOG_JSON environment
+    variable is set, and its end is kept for error reporting. The command is
+    executed directly, never through a shell.
+
     Args:
-        cmd: Command to run
+        cmd: Command to run, as an argv list or a string to be split shlex-style
         env: Environment variables
-        show_output: Whether to print command output to console
+        show_output: Whether to print command output to console. If False,
+                     stdout goes to the null device unread and stderr is
+                     only reported if the command fails.
         progress_char: Character to print for basic progress if no stdout/stderr.
                        Set to None or empty string to disable.
+        capture: Read stdout through a pipe and write it to stderr instead,
+                 like stderr itself.
     """
-    safe_cmd = cmd
-    
-    
-    if env and "PGPASSWORD" in env and env.get('PGPASSWORD'):
-        safe_cmd = cmd.replace(env['PGPASSWORD'], '********')
+    _ensure_logging()
+    args = list(_split(cmd) if isinstance(cmd, str) else cmd)
+    safe_cmd = _redact(shlex.join(args), env)
+    logger.info(_RUNNING_FORMAT, safe_cmd)
 
-    logger.info(f"Running command: {safe_cmd}")
+    if not show_output:
+        stdout = subprocess.DEVNULL
+    else:
+        stdout = subprocess.PIPE if capture else None
 
     try:
-        args = shlex.split(cmd)
-        
-        process = subprocess.Popen(
+        process = spawn(
             args,
-            env=env,
-            stdout=subprocess.PIPE,
+            env,
+            stdout=stdout,
             stderr=subprocess.PIPE,
-            text=True, 
-            bufsize=1,  
-            universal_newlines=True 
         )
 
-        
-        if show_output and process.stdout:
-            for line in iter(process.stdout.readline, ''):
-                logger.info(line.strip())
-                sys.stdout.flush() 
-            process.stdout.close()
+        # Whatever output is available is read and written at once; a partial
+        # last line waits for the next chunk.
+        show_stdout = show_output and logger.isEnabledFor(logging.INFO)
+        show_stderr = show_output and logger.isEnabledFor(logging.WARNING)
+        if os.environ.get("LOG_JSON"):
+            write_output = functools.partial(_write_json_output, cmd=safe_cmd)
+        else:
+            write_output = _write_output
+        feed_stdout, flush_stdout = _line_writer(write_output)
+        feed_stderr, flush_stderr = _line_writer(functools.partial(write_output, stream="stderr"))
 
-        
-        
-        
-        
-        
-        stderr_output = ""
-        if process.stderr:
-            stderr_output = process.stderr.read()
-            process.stderr.close()
+        stderr_output = _drain(
+            process, feed_stdout if show_stdout else _discard, feed_stderr if show_stderr else None,
+        ).decode(errors="replace")
+        flush_stdout()
+        flush_stderr()
+        for pipe in (process.stdout, process.stderr):
+            if pipe:
+                pipe.close()
 
         process.wait() 
 
         if process.returncode != 0:
             error_message = f"Command failed with exit code {process.returncode}"
             logger.error(error_message)
-            if stderr_output:
+            if stderr_output and not show_stderr:
                 logger.error("Error output:\n" + stderr_output.strip())
             raise RuntimeError(f"{error_message}\n{stderr_output.strip()}")
         else:
-            if stderr_output and show_output: 
-                logger.warning("Standard error output (may contain warnings):\n" + stderr_output.strip())
-            logger.info(f"Command '{safe_cmd}' executed successfully.")
+            logger.info(_SUCCEEDED_FORMAT, safe_cmd)
 
     except FileNotFoundError:
-        logger.error(f"Error: The command '{shlex.split(cmd)[0]}' was not found.")
+        logger.error(f"Error: The command '{args[0]}' was not found.")
         raise
     except Exception as e:
         logger.exception(f"Error executing command '{safe_cmd}': {e}")
         raise
 
 
+
+# Dumps compressed with zstd carry this suffix. A 128 MiB match window
+# (--long=27) lets zstd find the repetition across the rows of a large table;
+# decompression must be given the same window.
+ZSTD_SUFFIX = ".zst"
+_ZSTD_WINDOW = "--long=27"
+
+
+def is_compressed(path: Path) -> bool:
+    """Whether ``path`` names a zstd-compressed dump."""
+    return Path(path).suffix == ZSTD_SUFFIX
+
+
+def compressed_path(path: Path) -> Path:
+    """``path`` with the zstd suffix appended, e.g. backup.sql.zst."""
+    path = Path(path)
+    return path if is_compressed(path) else path.with_name(path.name + ZSTD_SUFFIX)
+
+
+def zstd_compress_command(output_file: Path) -> List[str]:
+    """argv compressing stdin into ``output_file`` on all cores."""
+    return ["zstd", "-T0", _ZSTD_WINDOW, "-q", "-f", "-o", str(output_file)]
+
+
+def zstd_decompress_command(input_file: Path) -> List[str]:
+    """argv decompressing ``input_file`` to stdout."""
+    return ["zstd", "-dc", _ZSTD_WINDOW, "-q", str(input_file)]
+
+
+@contextlib.contextmanager
+def open_dump(path: Path, mode: str) -> Iterator[BinaryIO]:
+    """
+    Open a dump for binary reading ("rb") or writing ("wb").
+
+    A zstd-compressed dump is read or written through a zstd process; the
+    yielded object is then the pipe to it, and zstd's exit status is checked
+    once the pipe is closed.
+    """
+    path = Path(path)
+    if not is_compressed(path):
+        with path.open(mode, buffering=0 if mode == "rb" else -1) as f:
+            yield f
+        return
+
+    if mode == "rb":
+        cmd = zstd_decompress_command(path)
+        process = spawn(cmd, stdout=subprocess.PIPE)
+        pipe = process.stdout
+    else:
+        cmd = zstd_compress_command(path)
+        process = spawn(cmd, stdin=subprocess.PIPE)
+        pipe = process.stdin
+    try:
+        with pipe:
+            yield pipe
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    if process.wait() != 0:
+        raise RuntimeError(f"Command failed with exit code {process.returncode}: {shlex.join(cmd)}")
+
+
+# Size of the reads the parent relays into the last stage of a pipeline.
+_RELAY_CHUNK = 1 << 20
+
+# os.splice (Linux, Python 3.10+) moves the relayed data between the two
+# pipes inside the kernel instead of copying it through this process.
+_splice = getattr(os, "splice", None)
+
+
+def _relay(source: int, sink: BinaryIO) -> None:
+    """Copy everything from file descriptor ``source`` into the pipe ``sink``."""
+    if _splice is not None:
+        target = sink.fileno()
+        while _splice(source, target, _RELAY_CHUNK, flags=os.SPLICE_F_MOVE):
+            pass
+        return
+    while True:
+        chunk = os.read(source, _RELAY_CHUNK)
+        if not chunk:
+            break
+        sink.write(chunk)
+
+
+def run_pipeline(commands: Sequence[Sequence[str]], env: Optional[Dict] = None) -> None:
+    """
+    Run commands connected stdout-to-stdin, like a shell pipeline.
+
+    The stages before the last are piped into each other directly; their
+    output is relayed into the last stage by this process (spliced from pipe
+    to pipe where the platform allows), which closes the last stage's stdin
+    only once every upstream stage has succeeded. If one fails, the last
+    stage is killed instead, so a consumer such as
+    ``psql --single-transaction`` never mistakes a truncated stream for the
+    end of its input; if the last stage exits before reading all of its
+    input, the upstream stages are killed. The last stage's stdout and every
+    stderr are inherited.
+
+    Args:
+        commands: The argv of each stage, at least two.
+        env: Environment variables for every stage
+
+    Raises:
+        RuntimeError: If any stage exits with a non-zero status.
+    """
+    _ensure_logging()
+    logger.info(f"Running pipeline: {_redact(' | '.join(shlex.join(argv) for argv in commands), env)}")
+    processes: List[subprocess.Popen] = []
+    try:
+        upstream = None
+        for argv in commands[:-1]:
+            process = spawn(argv, env, stdin=upstream, stdout=subprocess.PIPE)
+            if upstream is not None:
+                upstream.close()
+            upstream = process.stdout
+            processes.append(process)
+        last = spawn(commands[-1], env, stdin=subprocess.PIPE)
+        processes.append(last)
+
+        sink = last.stdin
+        _relay(upstream.fileno(), sink)
+        upstream.close()
+
+        for argv, process in zip(commands, processes[:-1]):
+            if process.wait() != 0:
+                raise RuntimeError(f"Command failed with exit code {process.returncode}: {shlex.join(argv)}")
+        sink.close()
+        if last.wait() != 0:
+            raise RuntimeError(f"Command failed with exit code {last.returncode}: {shlex.join(commands[-1])}")
+    except BaseException as e:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+        if isinstance(e, BrokenPipeError):
+            with contextlib.suppress(BrokenPipeError):
+                last.stdin.close()
+            raise RuntimeError(
+                f"Command exited early with exit code {last.returncode}: {shlex.join(commands[-1])}"
+            ) from e
+        raise
+    logger.info("Pipeline executed successfully.")
+
+
 if __name__ == '__main__':
     
     print("\n--- Example 1: Listing files with details (produces stdout) ---")
@@ -0,0 +1,332 @@
+import io
+import mmap
+import os
+import re
+
+import pytest
+
+from cloudsql_to_supabase import clean
+
+DUMP = b"""--
+-- PostgreSQL database dump
+--
+
+SET statement_timeout = 0;
+SET client_encoding = 'UTF8';
+SELECT pg_catalog.set_config('search_path', '', false);
+SET default_transaction_read_only = on;
+CREATE ROLE cloudsqlsuperuser;
+SET search_path = public, pg_catalog;
+
+--
+-- Name: analytics; Type: SCHEMA; Schema: -; Owner: bob
+--
+
+CREATE SCHEMA analytics;
+ALTER SCHEMA analytics OWNER TO bob;
+
+--
+-- Name: users; Type: TABLE; Schema: public; Owner: bob
+--
+
+CREATE TABLE public.users (
+    id integer NOT NULL,
+    email text
+);
+ALTER TABLE public.users OWNER TO cloudsqladmin;
+ALTER TABLE public.orders OWNER TO bob;
+
+--
+-- Data for Name: users; Type: TABLE DATA; Schema: public; Owner: bob
+--
+
+COPY public.users (id, email) FROM stdin;
+1\tCREATE ROLE not_a_statement;
+2\tALTER TABLE public.x OWNER TO bob;
+3\tSET search_path = public;
+\\.
+
+COPY public.empty (id) FROM stdin;
+\\.
+
+COPY public.orders (id, note) FROM stdin;
+1\tCOPY public.fake (id) FROM stdin;
+2\tpublic.users
+\\.
+
+--
+-- Name: users users_pkey; Type: CONSTRAINT; Schema: public; Owner: bob
+--
+
+ALTER TABLE ONLY public.users
+    ADD CONSTRAINT users_pkey PRIMARY KEY (id);
+SELECT * FROM public.users;
+"""
+
+COPY_DATA = [
+    b"1\tCREATE ROLE not_a_statement;\n2\tALTER TABLE public.x OWNER TO bob;\n3\tSET search_path = public;\n\\.\n",
+    b"1\tCOPY public.fake (id) FROM stdin;\n2\tpublic.users\n\\.\n",
+]
+
+
+def _clean(dump, target_schema, tmp_path, workers=1):
+    """Clean ``dump`` as clean-dump does, block by block from a file."""
+    path = tmp_path / "dump.sql"
+    path.write_bytes(dump)
+    cleaner = clean.DumpCleaner(input_file=path, output_file=tmp_path / "unused.sql",
+                                target_schema=target_schema, workers=workers)
+    out = io.BytesIO()
+    with open(path, "rb") as infile:
+        cleaner.clean_stream(infile, out)
+    return out.getvalue()
+
+
+def _copy_regions(dump):
+    """Offsets ``[start, end)`` of the data of each COPY in ``dump``, found line by line."""
+    regions, pos, start = [], 0, None
+    for line in io.BytesIO(dump):
+        if start is None and clean._is_copy_header(line):
+            start = pos + len(line)
+        elif start is not None and line == b"\\.\n":
+            regions.append((start, pos + len(line)))
+            start = None
+        pos += len(line)
+    return regions
+
+
+def _whole_block(dump, target_schema, **kwargs):
+    cleaner = clean.DumpCleaner(input_file="unused.sql", output_file="unused.sql",
+                                target_schema=target_schema, **kwargs)
+    return cleaner._clean_block(dump)[0]
+
+
+@pytest.mark.parametrize("target_schema", ["public", "development"])
+def test_copy_data_passes_through_unchanged(target_schema):
+    cleaned = _whole_block(DUMP, target_schema)
+    for data in COPY_DATA:
+        assert data in cleaned
+    assert b"CREATE ROLE cloudsqlsuperuser;" not in cleaned
+
+
+def test_copy_header_is_rewritten_for_target_schema():
+    cleaned = _whole_block(DUMP, "development")
+    assert b'COPY "development".users (id, email) FROM stdin;\n' in cleaned
+    assert b"COPY public.users" not in cleaned
+
+
+def test_copy_freeze():
+    cleaned = _whole_block(DUMP, "public", copy_freeze=True)
+    assert b"COPY public.users (id, email) FROM stdin WITH (FREEZE);\n" in cleaned
+    assert b"COPY public.empty (id) FROM stdin WITH (FREEZE);\n" in cleaned
+    assert b"1\tCOPY public.fake (id) FROM stdin;\n" in cleaned
+
+
+@pytest.mark.parametrize("target_schema", ["public", "development"])
+@pytest.mark.parametrize("block_size", [1, 7, 40, 64, 100, 333])
+def test_block_boundaries_do_not_change_output(monkeypatch, tmp_path, target_schema, block_size):
+    expected = _whole_block(DUMP, target_schema)
+    monkeypatch.setattr(clean, "_BLOCK_SIZE", block_size)
+    assert _clean(DUMP, target_schema, tmp_path) == expected
+
+
+@pytest.mark.parametrize("target_schema", ["public", "development"])
+@pytest.mark.parametrize("block_size", [1, 40, 100])
+def test_workers_match_serial_output(monkeypatch, tmp_path, target_schema, block_size):
+    monkeypatch.setattr(clean, "_BLOCK_SIZE", block_size)
+    serial = _clean(DUMP, target_schema, tmp_path)
+    assert _clean(DUMP, target_schema, tmp_path, workers=3) == serial
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 40, 64, 100, 333])
+def test_ranges_with_copy_state(tmp_path, block_size):
+    path = tmp_path / "dump.sql"
+    path.write_bytes(DUMP)
+    regions = _copy_regions(DUMP)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        ranges = list(clean._ranges_with_copy_state(mm, block_size))
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(DUMP)
+    for (_, end, _), (start, _, _) in zip(ranges, ranges[1:]):
+        assert end == start
+    for start, end, in_copy in ranges:
+        assert DUMP[end - 1:end] == b"\n"
+        assert in_copy == any(data_start <= start < data_end for data_start, data_end in regions)
+
+
+def test_copy_data_end():
+    block = b"1\ta\n2\tb\n\\.\nSELECT 1;\n"
+    assert clean._copy_data_end(block, 0) == (block.index(b"SELECT"), False)
+    assert clean._copy_data_end(b"\\.\nSELECT 1;\n", 0) == (3, False)
+    assert clean._copy_data_end(b"1\ta\n2\tb\n", 0) == (8, True)
+
+
+@pytest.mark.parametrize("line, expected", [
+    # \1 of the search_path rule
+    (b"SET search_path = public, pg_catalog;\n", b'SET search_path = "development", public, pg_catalog;\n'),
+    (b"SET search_path = public;\n", b'SET search_path = "development", public;\n'),
+    # \g<0> of the rule dropping other schemas
+    (b"CREATE SCHEMA analytics;\n", b"-- Removed CREATE SCHEMA for non-target, non-public schema: CREATE SCHEMA analytics;\n"),
+    (b"SELECT * FROM public.users;\n", b'SELECT * FROM "development".users;\n'),
+    (b"ALTER TABLE ONLY public.users\n", b'ALTER TABLE ONLY "development".users\n'),
+    (b"ALTER TABLE public.users OWNER TO bob;\n", b'ALTER TABLE "development".users OWNER TO postgres;\n'),
+    (b"CREATE SCHEMA development;\n", b"-- CREATE SCHEMA development; (commented out, handled by import script)\n"),
+])
+def test_fused_replacement_templates(line, expected):
+    replace = clean._build_replacer(clean._build_replacement_rules("development", "postgres"))
+    assert replace(line)[0] == expected
+
+
+@pytest.mark.parametrize("target_schema, line, expected", [
+    ("public", b"SET search_path = analytics, pg_catalog;\n", b"SET search_path = public, pg_catalog;\n"),
+    ("public", b"SET search_path = public;\n", b"SET search_path = public, pg_catalog;\n"),
+    ("development", b"SET search_path = public, pg_catalog;\n", b'SET search_path = "development", public, pg_catalog;\n'),
+    ("development", b"SET search_path = analytics;\n", b"SET search_path = analytics;\n"),
+])
+def test_search_path_rewrites(target_schema, line, expected):
+    assert _whole_block(line, target_schema) == expected
+
+
+@pytest.mark.parametrize("target_schema", ["public", "development"])
+def test_empty_search_path_is_commented_out(target_schema):
+    line = b"SELECT pg_catalog.set_config('search_path', '', false);\n"
+    assert _whole_block(line, target_schema).startswith(b"-- SELECT pg_catalog.set_config('search_path', '', false);")
+
+
+# Lines a rule matches regardless of case, as hand-edited dumps may have them.
+MIXED_CASE = b"""ALTER TABLE public.users owner to z;
+alter table public.orders Owner To "bob";
+ALTER TABLE public.accounts
+    owner to z;
+SELECT * FROM PUBLIC.users;
+INSERT INTO Public.orders VALUES (1);
+1\tnot a statement
+"""
+
+
+@pytest.mark.parametrize("target_schema", ["public", "development"])
+def test_prefilter_and_fallback_agree(target_schema):
+    cleaner = clean.DumpCleaner(input_file="unused.sql", output_file="unused.sql", target_schema=target_schema)
+    scanned = cleaner._clean_block(MIXED_CASE)[0]
+    # The fallback taken without hyperscan: keyword prescreen and rule hints.
+    cleaner._scan_skips = cleaner._scan_replacements = None
+    assert cleaner._clean_block(MIXED_CASE)[0] == scanned
+    expected = b"".join(cleaner._apply_replacements(line)[0] for line in io.BytesIO(MIXED_CASE))
+    assert scanned == expected
+    assert b"owner to z" not in scanned.lower()
+SPLIT_DUMP = b"""--
+-- PostgreSQL database dump
+--
+
+SET statement_timeout = 0;
+SET client_encoding = 'UTF8';
+SELECT pg_catalog.set_config('search_path', '', false);
+
+--
+-- Name: orders; Type: TABLE; Schema: public; Owner: bob
+--
+
+CREATE TABLE public.orders (
+    id integer NOT NULL,
+    note text
+);
+
+--
+-- Name: users; Type: TABLE; Schema: public; Owner: bob
+--
+
+CREATE TABLE public.users (
+    id integer NOT NULL
+);
+
+--
+-- Data for Name: orders; Type: TABLE DATA; Schema: public; Owner: bob
+--
+
+COPY public.orders (id, note) FROM stdin;
+1\tfirst
+-- Name: not a TOC entry; Type: TABLE; Schema: public; Owner: bob
+2\tsecond
+\\.
+
+
+--
+-- Data for Name: empty; Type: TABLE DATA; Schema: public; Owner: bob
+--
+
+COPY public.empty (id) FROM stdin;
+\\.
+
+
+--
+-- Data for Name: users; Type: TABLE DATA; Schema: public; Owner: bob
+--
+
+COPY public.users (id) FROM stdin;
+1
+2
+\\.
+
+
+--
+-- Name: users users_pkey; Type: CONSTRAINT; Schema: public; Owner: bob
+--
+
+ALTER TABLE ONLY public.users
+    ADD CONSTRAINT users_pkey PRIMARY KEY (id);
+"""
+
+SPLIT_SETTINGS = b"SET statement_timeout = 0;\nSET client_encoding = 'UTF8';\nSELECT pg_catalog.set_config('search_path', '', false);\n"
+
+_TABLE_COPY_HEADER = re.compile(rb"^COPY public\.(\w+) ", re.MULTILINE)
+
+
+def _split(tmp_path, dump):
+    dump_file = tmp_path / "dump.sql"
+    dump_file.write_bytes(dump)
+    return clean.split_dump_by_table(dump_file, tmp_path / "split")
+
+
+def _no_sendfile(*args):
+    raise OSError("sendfile between files not supported")
+
+
+@pytest.mark.parametrize("copy", ["copy_file_range", "sendfile", "mmap"])
+def test_split_pieces_reassemble_the_dump(monkeypatch, tmp_path, copy):
+    # Fall back as on platforms without the faster copies.
+    if copy != "copy_file_range":
+        monkeypatch.delattr(os, "copy_file_range", raising=False)
+    if copy == "mmap":
+        monkeypatch.setattr(os, "sendfile", _no_sendfile)
+    pre_data, data, post_data = _split(tmp_path, SPLIT_DUMP)
+    pieces = [pre_data.read_bytes()]
+    for path in [*data, post_data]:
+        content = path.read_bytes()
+        # Every piece after the first repeats the session settings.
+        assert content.startswith(SPLIT_SETTINGS)
+        pieces.append(content[len(SPLIT_SETTINGS):])
+    assert b"".join(pieces) == SPLIT_DUMP
+
+
+def test_split_puts_each_copy_in_its_own_file(tmp_path):
+    pre_data, data, post_data = _split(tmp_path, SPLIT_DUMP)
+    assert [_TABLE_COPY_HEADER.findall(path.read_bytes()) for path in data] == [[b"orders"], [b"empty"], [b"users"]]
+    assert b"-- Name: not a TOC entry" in data[0].read_bytes()
+    assert b"2\tsecond\n\\.\n" in data[0].read_bytes()
+    assert not _TABLE_COPY_HEADER.search(pre_data.read_bytes())
+    assert b"CREATE TABLE public.users" in pre_data.read_bytes()
+    assert not _TABLE_COPY_HEADER.search(post_data.read_bytes())
+    assert b"ADD CONSTRAINT users_pkey" in post_data.read_bytes()
+
+
+def test_split_dump_without_data(tmp_path):
+    dump = SPLIT_DUMP[:SPLIT_DUMP.index(b"--\n-- Data for Name: orders")]
+    pre_data, data, post_data = _split(tmp_path, dump)
+    assert data == []
+    assert pre_data.read_bytes() == dump
+    assert post_data.read_bytes() == SPLIT_SETTINGS
+
+
+def test_split_empty_dump(tmp_path):
+    pre_data, data, post_data = _split(tmp_path, b"")
+    assert data == []
+    assert pre_data.read_bytes() == b""
+    assert post_data.read_bytes() == b""
@@ -0,0 +1,122 @@
+import os
+import sys
+
+import pytest
+
+from cloudsql_to_supabase import config, import_
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="stub client commands are shell scripts")
+
+# Three tables; the biggest, loaded first, holds the word FAIL.
+DUMP = b"""SET client_encoding = 'UTF8';
+
+--
+-- Name: a; Type: TABLE; Schema: public; Owner: bob
+--
+
+CREATE TABLE public.a (id integer);
+
+--
+-- Data for Name: a; Type: TABLE DATA; Schema: public; Owner: bob
+--
+
+COPY public.a (id) FROM stdin;
+FAIL FAIL FAIL FAIL FAIL FAIL FAIL FAIL FAIL FAIL FAIL FAIL FAIL FAIL FAIL FAIL
+\\.
+
+--
+-- Data for Name: b; Type: TABLE DATA; Schema: public; Owner: bob
+--
+
+COPY public.b (id) FROM stdin;
+1
+\\.
+
+--
+-- Data for Name: c; Type: TABLE DATA; Schema: public; Owner: bob
+--
+
+COPY public.c (id) FROM stdin;
+2
+\\.
+
+--
+-- Name: a a_pkey; Type: CONSTRAINT; Schema: public; Owner: bob
+--
+
+ALTER TABLE ONLY public.a ADD CONSTRAINT a_pkey PRIMARY KEY (id);
+"""
+
+# Stands in for psql and pg_restore. Logs the file it was given, and fails
+# like psql with ON_ERROR_STOP on one containing FAIL; other loads take
+# STUB_DELAY seconds.
+STUB_PSQL = """#!/bin/sh
+for arg in "$@"; do file="$arg"; done
+echo "$(basename "$file")" >> "{log}"
+if grep -q FAIL "$file"; then
+    echo "ERROR:  boom" >&2
+    exit 3
+fi
+sleep "${{STUB_DELAY:-0}}"
+"""
+
+
+@pytest.fixture
+def stub_env(monkeypatch, tmp_path):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name in ("psql", "pg_restore"):
+        stub = bin_dir / name
+        stub.write_text(STUB_PSQL.format(log=tmp_path / "psql.log"))
+        stub.chmod(0o755)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setenv("SUPABASE_HOST", "localhost")
+    config.Config.reload()
+    yield {"PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}"}
+    monkeypatch.undo()
+    config.Config.reload()
+
+
+def _loaded(tmp_path):
+    return (tmp_path / "psql.log").read_text().split()
+
+
+def test_load_tables_in_parallel(tmp_path, stub_env):
+    dump_file = tmp_path / "dump.sql"
+    dump_file.write_bytes(DUMP.replace(b"FAIL", b"0"))
+    import_.load_tables_in_parallel(dump_file, "public", stub_env, jobs=2)
+    loaded = _loaded(tmp_path)
+    assert loaded[0] == "pre_data.sql" and loaded[-1] == "post_data.sql"
+    assert sorted(loaded[1:-1]) == ["data_0000.sql", "data_0001.sql", "data_0002.sql"]
+
+
+def test_load_tables_in_parallel_reports_tables_not_started(tmp_path, stub_env):
+    dump_file = tmp_path / "dump.sql"
+    dump_file.write_bytes(DUMP)
+    # The worker may pick up the next table before the failure cancels it,
+    # but not the one after that while the next is still loading.
+    env = dict(stub_env, STUB_DELAY="1")
+    with pytest.raises(RuntimeError) as excinfo:
+        import_.load_tables_in_parallel(dump_file, "public", env, jobs=1)
+    lines = str(excinfo.value).split("\n")
+    assert lines[:3] == ["1 table data file(s) failed to load:", "data_0000.sql: Command failed with exit code 3", "ERROR:  boom"]
+    not_loaded = lines[-1]
+    loaded = _loaded(tmp_path)
+    assert loaded[:2] == ["pre_data.sql", "data_0000.sql"]
+    # Post-data is not loaded after a failure.
+    assert "post_data.sql" not in loaded
+    started = loaded[2:]
+    assert not_loaded.startswith(f"{2 - len(started)} not loaded, rerun needed: ")
+    assert sorted(started + not_loaded.split(": ", 1)[1].split(", ")) == ["data_0001.sql", "data_0002.sql"]
+
+
+def test_schema_is_ignored_for_archives(tmp_path, stub_env, monkeypatch, caplog):
+    archive = tmp_path / "backup.dump"
+    archive.write_bytes(b"PGDMP\x01\x0e\x00")
+    for name in ("CLOUDSQL_USER", "CLOUDSQL_HOST", "CLOUDSQL_DB", "SUPABASE_PASSWORD"):
+        monkeypatch.setenv(name, "x")
+    config.Config.reload()
+    monkeypatch.setattr(import_, "supabase_env", lambda password=None: stub_env)
+    import_.import_to_supabase(archive, schema="analytics", jobs=1)
+    assert _loaded(tmp_path) == ["backup.dump"]
+    assert "Ignoring schema analytics" in caplog.text
@@ -0,0 +1,85 @@
+import json
+import shlex
+import sys
+
+import pytest
+
+from cloudsql_to_supabase import utils
+
+# Writes its diagnostics to stderr as a client command does, the last line
+# without a newline.
+NOISY = [sys.executable, "-c", "import sys; sys.stderr.write('pg_dump: reading\\npg_dump: dumping a')"]
+
+
+def test_stderr_is_streamed_as_log_lines(monkeypatch, capsys):
+    monkeypatch.delenv("LOG_JSON", raising=False)
+    utils.run_command(NOISY)
+    lines = capsys.readouterr().err.splitlines()
+    assert [line.split(" - ", 3)[2:] for line in lines] == [
+        ["WARNING", "pg_dump: reading"], ["WARNING", "pg_dump: dumping a"],
+    ]
+
+
+def test_stderr_is_streamed_as_json_lines(monkeypatch, capsys):
+    monkeypatch.setenv("LOG_JSON", "1")
+    utils.run_command(NOISY)
+    records = [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+    assert [(r["stream"], r["line"]) for r in records] == [("stderr", "pg_dump: reading"), ("stderr", "pg_dump: dumping a")]
+    assert {r["cmd"] for r in records} == {shlex.join(NOISY)}
+
+
+def test_failure_reports_the_end_of_a_large_stderr(capsys):
+    # Far more than the pipe holds, while stdout is read too.
+    script = (
+        "import sys\n"
+        "for i in range(20000): sys.stderr.write(f'line {i:05}\\n'); print(i)\n"
+        "sys.stderr.write('ERROR:  the reason\\n'); sys.exit(4)\n"
+    )
+    with pytest.raises(RuntimeError) as excinfo:
+        utils.run_command([sys.executable, "-c", script], capture=True)
+    message = str(excinfo.value)
+    assert message.startswith("Command failed with exit code 4\n")
+    assert message.endswith("line 19999\nERROR:  the reason")
+    assert len(message) < utils._STDERR_TAIL + 100
+    assert "line 00000" not in message
+
+
+# Binary data larger than a pipe and a relay chunk, with every byte value.
+PIPELINE_DATA = bytes(range(256)) * (3 << 12) + b"\0end"
+
+
+def _stage(script, *args):
+    return [sys.executable, "-c", script, *map(str, args)]
+
+
+def _producer(path):
+    return _stage("import shutil, sys; shutil.copyfileobj(open(sys.argv[1], 'rb'), sys.stdout.buffer)", path)
+
+
+def _consumer(path):
+    return _stage("import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open(sys.argv[1], 'wb'))", path)
+
+
+@pytest.mark.parametrize("splice", [True, False])
+def test_pipeline_relays_output_byte_for_byte(monkeypatch, tmp_path, splice):
+    if not splice:
+        monkeypatch.setattr(utils, "_splice", None)
+    source, target = tmp_path / "source", tmp_path / "target"
+    source.write_bytes(PIPELINE_DATA)
+    identity = _stage("import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, sys.stdout.buffer)")
+    utils.run_pipeline([_producer(source), identity, _consumer(target)])
+    assert target.read_bytes() == PIPELINE_DATA
+
+
+def test_pipeline_reports_the_failing_stage(tmp_path):
+    failing = _stage("import sys; sys.stdout.write('partial'); sys.exit(5)")
+    with pytest.raises(RuntimeError, match=r"^Command failed with exit code 5: .*sys\.exit\(5\)"):
+        utils.run_pipeline([failing, _consumer(tmp_path / "target")])
+
+
+def test_pipeline_reports_a_consumer_that_exits_early(tmp_path):
+    source = tmp_path / "source"
+    source.write_bytes(PIPELINE_DATA * 8)
+    early = _stage("import sys; sys.stdin.buffer.read(10); sys.exit(0)")
+    with pytest.raises(RuntimeError, match=r"^Command exited early with exit code 0: "):
+        utils.run_pipeline([_producer(source), early])